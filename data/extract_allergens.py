@@ -5,133 +5,154 @@ Downloads from HuggingFace, filters for targets where:
 - Target recipe is tagged "gluten-free"
 
 Outputs recipes to data/recipepairs_glutenfree_eval.json
+(and a SQLite recipe store next to it for RecipeRetriever)
 """
 
+import sys
 import json
 from pathlib import Path
 from glob import glob
 import pandas as pd
 import numpy as np
 
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.recipe_store import write_recipe_store
+
 # --- Config ---
 OUTPUT_PATH = Path(__file__).parent.parent / "data" / "recipepairs_glutenfree_eval.json"
 TARGET_COUNT = 10000
 MAX_PER_TARGET = 5  # Max appearances per target recipe (limits duplicates)
 
+# Only these columns are read from the parquet tables
+RECIPE_COLUMNS = ["id", "name", "ingredients", "steps", "categories"]
+PAIR_COLUMNS = ["target"]
+
 # HuggingFace paths
 CACHE_BASE = Path.home() / ".cache/huggingface/hub/datasets--lishuyang--recipepairs/snapshots"
 HF_RECIPES_URL = "hf://datasets/lishuyang/recipepairs/recipes.parquet"
 HF_PAIRS_URL = "hf://datasets/lishuyang/recipepairs/pairs.parquet"
 
-def load_parquet(table_name: str) -> pd.DataFrame:
+def load_parquet(table_name: str, columns=None) -> pd.DataFrame:
     """Load parquet from local cache if available, else download from HuggingFace and cache it."""
     cache_pattern = str(CACHE_BASE / f"*/{table_name}.parquet")
     matches = glob(cache_pattern)
     if matches:
         print(f"  (using local cache)")
-        return pd.read_parquet(matches[0])
+        return pd.read_parquet(matches[0], columns=columns)
     
     print(f"  (downloading from HuggingFace...)")
     url = HF_RECIPES_URL if table_name == "recipes" else HF_PAIRS_URL
     df = pd.read_parquet(url)
     
-    # Save to cache for future runs
+    # Save the full table to cache for future runs
     cache_dir = CACHE_BASE / "local_cache"
     cache_dir.mkdir(parents=True, exist_ok=True)
     cache_file = cache_dir / f"{table_name}.parquet"
     df.to_parquet(cache_file)
     print(f"  (cached to {cache_file})")
     
-    return df
+    return df[columns] if columns is not None else df
+
+def normalize_categories(cats):
+    if isinstance(cats, (list, tuple, np.ndarray)):
+        return [str(c).strip().lower().replace("-", "_") for c in cats]
+    if isinstance(cats, str):
+        return [cats.strip().lower().replace("-", "_")]
+    return []
+
+def to_plain_list(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value] if pd.notna(value) else []
+
+def glutenfree_mask(recipes: pd.DataFrame) -> pd.Series:
+    """Rows tagged gluten_free/gluten-free, from one explode of the category lists."""
+    categories = recipes["categories"].explode().dropna()
+    normalized = categories.astype(str).str.strip().str.lower().str.replace("-", "_", regex=False)
+    return recipes.index.isin(normalized.index[normalized == "gluten_free"])
+
+def name_keys(recipes: pd.DataFrame) -> pd.Series:
+    """Case-insensitive recipe names used for deduplication."""
+    return recipes["name"].str.strip().str.lower()
+
+def first_per_name(recipes: pd.DataFrame) -> pd.DataFrame:
+    return recipes[~name_keys(recipes).duplicated()]
+
+def first_per_target_and_name(recipes: pd.DataFrame, limit: int) -> pd.DataFrame:
+    """
+    Rows in order whose id and name no earlier kept row has, up to `limit`.
+    With unique ids this is a name dedup; repeated ids need the greedy scan,
+    since a row dropped for its name leaves its id free for a later row.
+    """
+    if recipes["id"].is_unique:
+        return first_per_name(recipes).head(limit)
+    seen_ids, seen_names, keep = set(), set(), []
+    for row, tid, key in zip(recipes.index, recipes["id"], name_keys(recipes)):
+        if len(keep) >= limit:
+            break
+        if tid in seen_ids or key in seen_names:
+            continue
+        seen_ids.add(tid)
+        seen_names.add(key)
+        keep.append(row)
+    return recipes.loc[keep]
+
+def select_glutenfree(recipes: pd.DataFrame, pairs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Gluten-free targets in pair order, each target and name at most once,
+    topped up from all gluten-free recipes (in table order) if there are
+    fewer than TARGET_COUNT. Pairs resolve a repeated recipe id to its last
+    row; the fallback scans every row.
+    """
+    is_gf = glutenfree_mask(recipes)
+    gf = recipes[is_gf & ~recipes["id"].duplicated(keep="last")]
+
+    # Pass 1: from pairs. Repeat pairs of a target carry the same name, so
+    # once its first pair is accepted or rejected, later ones are rejected too.
+    gf_targets = pairs["target"][pairs["target"].isin(gf["id"])]
+    targets = gf_targets.drop_duplicates()
+    from_pairs = targets.to_frame("id").merge(gf, on="id", how="left")
+    selected = first_per_name(from_pairs).head(TARGET_COUNT)
+
+    # Pass 2 (fallback): from all recipes if we didn't reach target count
+    if len(selected) < TARGET_COUNT:
+        print(f"Fallback: scanning all recipes (need {TARGET_COUNT - len(selected)} more)...")
+        rows = recipes[is_gf]
+        # Every pass-1 pair and pass-2 row of a target counts towards MAX_PER_TARGET
+        seen_pairs = rows["id"].map(gf_targets.value_counts()).fillna(0)
+        under_cap = seen_pairs + rows.groupby("id").cumcount() < MAX_PER_TARGET
+        rest = rows[under_cap & ~rows["id"].isin(selected["id"]) & ~name_keys(rows).isin(name_keys(selected))]
+        selected = pd.concat([selected, first_per_target_and_name(rest, TARGET_COUNT - len(selected))],
+                             ignore_index=True)
+    return selected
 
 def main():
     print("Loading recipes table...")
-    recipes_df = load_parquet("recipes")
+    recipes_df = load_parquet("recipes", columns=RECIPE_COLUMNS)
     print(f"  → {len(recipes_df):,} recipes loaded")
 
-    print(recipes_df.columns)
-
     print("Loading pairs table...")
-    pairs_df = load_parquet("pairs")
+    pairs_df = load_parquet("pairs", columns=PAIR_COLUMNS)
     print(f"  → {len(pairs_df):,} pairs loaded")
 
-    # Index recipes by ID for O(1) lookup
-    print("Building recipe lookup index...")
-    recipe_lookup = {row["id"]: row.to_dict() for _, row in recipes_df.iterrows()}
-
-    def normalize_categories(cats):
-        if isinstance(cats, (list, tuple, np.ndarray)):
-            return [str(c).strip().lower().replace("-", "_") for c in cats]
-        if isinstance(cats, str):
-            return [cats.strip().lower().replace("-", "_")]
-        return []
-
-    def to_plain_list(value):
-        if isinstance(value, np.ndarray):
-            return value.tolist()
-        if isinstance(value, (list, tuple)):
-            return list(value)
-        return [value] if pd.notna(value) else []
-
-    def is_glutenfree_target(pair):
-        """Check target recipe categories for gluten_free/gluten-free tag."""
-        target = recipe_lookup.get(pair["target"])
-        if not target:
-            return False
-        norm = normalize_categories(target.get("categories", []))
-        return "gluten_free" in norm
-
-    # Collect unique gluten-free targets (from pairs). If none found, fall back to all recipes.
     print(f"Collecting gluten-free targets (goal: {TARGET_COUNT}, max {MAX_PER_TARGET}/target)...")
-    gf_recipes = []
-    target_counts = {}
-    seen_targets = set()      # unique by target id
-    seen_names = set()        # also dedupe by recipe name (case-insensitive)
-
-    def add_target(target):
-        tid = target["id"]
-        tname = target["name"].strip()
-        key = tname.lower()
-        if target_counts.get(tid, 0) >= MAX_PER_TARGET:
-            return False
-        if tid in seen_targets or key in seen_names:
-            target_counts[tid] = target_counts.get(tid, 0) + 1
-            return False
-        seen_targets.add(tid)
-        seen_names.add(key)
-        target_counts[tid] = target_counts.get(tid, 0) + 1
-        gf_recipes.append({
-            "id": int(target["id"]),
-            "name": target["name"],
-            "ingredients": to_plain_list(target.get("ingredients", [])),
-            "steps": to_plain_list(target.get("steps", [])),
-            "categories": normalize_categories(target.get("categories", [])),
+    selected = select_glutenfree(recipes_df, pairs_df)
+    gf_recipes = [
+        {
+            "id": int(row.id),
+            "name": row.name,
+            "ingredients": to_plain_list(row.ingredients),
+            "steps": to_plain_list(row.steps),
+            "categories": normalize_categories(row.categories),
             "constraint": "gluten-free"
-        })
-        print(f"  [{len(gf_recipes)}/{TARGET_COUNT}] {tname}")
-        return True
-
-    # Pass 1: from pairs
-    for _, pair in pairs_df.iterrows():
-        if len(gf_recipes) >= TARGET_COUNT:
-            break
-        if not is_glutenfree_target(pair):
-            continue
-        target = recipe_lookup.get(pair["target"])
-        if not target:
-            continue
-        add_target(target)
-
-    # Pass 2 (fallback): from all recipes if we didn't reach target count
-    if len(gf_recipes) < TARGET_COUNT:
-        print(f"Fallback: scanning all recipes (need {TARGET_COUNT - len(gf_recipes)} more)...")
-        for _, row in recipes_df.iterrows():
-            if len(gf_recipes) >= TARGET_COUNT:
-                break
-            norm = normalize_categories(row.get("categories", []))
-            if "gluten_free" not in norm:
-                continue
-            add_target(row)
+        }
+        for row in selected.itertuples(index=False)
+    ]
+    print(f"  → {len(gf_recipes):,} recipes selected")
 
     # Save output
     output = {
@@ -147,5 +168,9 @@ def main():
     OUTPUT_PATH.write_text(json.dumps(output, indent=2))
     print(f"Saved to {OUTPUT_PATH}")
 
+    store_path = write_recipe_store(OUTPUT_PATH.with_suffix(".sqlite"), gf_recipes,
+                                    metadata=output["metadata"])
+    print(f"Saved recipe store to {store_path}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,43 +1,20 @@
 import json
 import os
+import sys
 import pandas as pd
 import random
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.recipe_store import write_recipe_store
+from retrieval.documents import CATEGORIES, categorize_recipe
 
 # Configuration
 TOTAL_RECIPES = 1000
 RANDOM_SEED = 42
 
-# Categories for diverse sampling (keyword -> category name)
-# Recipes will be sampled proportionally from each category
-CATEGORIES = {
-    "chicken": ["chicken", "poultry"],
-    "beef": ["beef", "steak"],
-    "pork": ["pork", "bacon", "ham", "sausage"],
-    "seafood": ["fish", "salmon", "shrimp", "tuna", "seafood", "crab", "lobster"],
-    "vegetarian": ["vegetable", "veggie", "vegan", "tofu", "lentil", "bean"],
-    "pasta": ["pasta", "spaghetti", "lasagna", "lasagne", "noodle", "macaroni"],
-    "soup": ["soup", "stew", "chowder", "broth"],
-    "salad": ["salad"],
-    "dessert": ["cake", "cookie", "pie", "brownie", "chocolate", "ice cream", "dessert"],
-    "bread": ["bread", "muffin", "biscuit", "roll", "loaf"],
-    "breakfast": ["pancake", "waffle", "omelette", "omelet", "egg", "breakfast"],
-    "rice": ["rice", "risotto", "fried rice"],
-    "pizza": ["pizza"],
-    "sandwich": ["sandwich", "wrap", "burger"],
-    "other": []  # Catch-all for unmatched recipes
-}
-
-def categorize_recipe(title):
-    """Assign a recipe to a category based on title keywords."""
-    title_lower = title.lower()
-    for category, keywords in CATEGORIES.items():
-        if category == "other":
-            continue
-        for keyword in keywords:
-            if keyword in title_lower:
-                return category
-    return "other"
-
 def filter_quality_recipes(df):
     """Filter for recipes with reasonable complexity."""
     def count_items(s):
@@ -143,6 +120,11 @@ def main():
         json.dump(recipes_out, f, indent=2)
 
     print(f"\nSaved {len(recipes_out['recipes'])} recipes to {out_path}")
+
+    # Columnar copy with parsed ingredients/steps for RecipeRetriever
+    store_path = write_recipe_store(Path(out_path).with_suffix(".sqlite"), recipes_out["recipes"],
+                                    metadata={"version": recipes_out["version"]})
+    print(f"Saved recipe store to {store_path}")
     
     # Print category distribution in final output
     from collections import Counter
@@ -5,10 +5,12 @@ Tracks runtime, model configs, and experiment metadata.
 
 import json
 import time
+import numpy as np
 from datetime import datetime
 from pathlib import Path
 from backports.zoneinfo import ZoneInfo
 from dataclasses import dataclass, asdict
+from evaluation.profiler import PROFILER
 
 @dataclass
 class ExperimentMetadata:
@@ -24,20 +26,45 @@ class ExperimentMetadata:
     end_time: str = None
     total_duration_seconds: float = None
     num_samples: int = None
+    seed: int = None
+    response_cache: dict = None  # hit/miss stats of the LLM response cache, None if bypassed
+    latency: dict = None  # p50/p95/p99 of the per-sample generation metrics, see summarize_latency
+    pipeline: dict = None  # per-stage utilisation and queue depths of the RAG pipeline
+    prompt_layout: str = None  # "inline" or "shared_prefix" (instructions as a reusable system prompt)
+    prompt_eval: dict = None  # prompt tokens/seconds Ollama evaluated per sample, and savings vs inline
+    structured_output: bool = False  # JSON-constrained output, stopped at the end of the top-level object
+    output_stats: dict = None  # parse-failure rate and tokens per sample, and savings vs unconstrained
+    profile: dict = None  # per-stage span totals when run with profiling
+    trace_file: str = None  # Chrome trace / Perfetto JSON of the profiled run
     timezone: str = "Europe/Berlin"
     
     def to_dict(self):
         return asdict(self)
 
 class ExperimentTimer:
-    """Context manager for timing experiments."""
+    """
+    Context manager for timing experiments.
+
+    With profile=True the run becomes the root span of the profiler: stages
+    instrumented with `span`/`profiled` are recorded underneath it, their
+    totals go into metadata.profile and, given a trace_path, a Chrome trace
+    is written on exit.
+    """
     
-    def __init__(self, metadata: ExperimentMetadata):
+    def __init__(self, metadata: ExperimentMetadata, profile: bool = False, trace_path: Path = None):
         self.metadata = metadata
+        self.profile = profile
+        self.trace_path = trace_path
         self.start_time = None
         self.end_time = None
+        self._span = None
     
     def __enter__(self):
+        if self.profile:
+            PROFILER.reset()
+            PROFILER.enable()
+            self._span = PROFILER.span(f"experiment.{self.metadata.condition}")
+            self._span.__enter__()
         self.start_time = time.time()
         tz = ZoneInfo(self.metadata.timezone)
         self.metadata.start_time = datetime.now(tz).isoformat()
@@ -53,6 +80,12 @@ class ExperimentTimer:
         tz = ZoneInfo(self.metadata.timezone)
         self.metadata.end_time = datetime.now(tz).isoformat()
         self.metadata.total_duration_seconds = self.end_time - self.start_time
+        if self._span is not None:
+            self._span.__exit__(exc_type, exc_val, exc_tb)
+            PROFILER.disable()
+            self.metadata.profile = PROFILER.summary()
+            if self.trace_path is not None:
+                self.metadata.trace_file = str(PROFILER.save_chrome_trace(self.trace_path))
         
         hours, remainder = divmod(self.metadata.total_duration_seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
@@ -67,15 +100,96 @@ class ExperimentTimer:
             print(f"Avg time per sample: {avg_time:.2f}s")
         print(f"{'='*60}\n")
 
+LATENCY_FIELDS = ("queue_s", "ttft_s", "total_s", "prompt_tokens", "prompt_eval_s", "eval_tokens",
+                  "eval_s", "tokens_per_sec", "budget_used")
+PERCENTILES = (50, 95, 99)
+
+def summarize_latency(results):
+    """
+    Percentiles of the per-sample "metrics" recorded by the generation scripts.
+    Cached samples carry the timings of the run that generated them, so they
+    are only counted (num_cached), not included in the percentiles.
+    """
+    recorded = [r["metrics"] for r in results if r.get("metrics")]
+    metrics = [m for m in recorded if not m.get("cached")]
+    summary = {
+        "num_samples": len(recorded),
+        "num_cached": len(recorded) - len(metrics),
+        "hit_max_tokens": sum(m.get("done_reason") == "length" for m in metrics),
+        # Streams cancelled at the end of the JSON have no Ollama counters or throughput
+        "counters_unavailable": sum(not m.get("counters_available", True) for m in metrics),
+    }
+    for field in LATENCY_FIELDS:
+        values = np.array([m[field] for m in metrics if m.get(field) is not None], dtype=float)
+        if len(values):
+            summary[field] = {
+                "mean": round(float(values.mean()), 4),
+                **{f"p{q}": round(float(p), 4)
+                   for q, p in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+            }
+    return summary
+
+def summarize_prompt_eval(results):
+    """Prompt tokens Ollama evaluated per sample and the time it took, over uncached samples."""
+    metrics = [r["metrics"] for r in results if r.get("metrics") and not r["metrics"].get("cached")]
+    tokens = [m["prompt_tokens"] for m in metrics if m.get("prompt_tokens") is not None]
+    seconds = [m["prompt_eval_s"] for m in metrics if m.get("prompt_eval_s") is not None]
+    return {
+        "num_samples": len(metrics),
+        "prompt_tokens_mean": round(float(np.mean(tokens)), 2) if tokens else None,
+        "prompt_eval_s_mean": round(float(np.mean(seconds)), 4) if seconds else None,
+        "prompt_eval_s_total": round(float(np.sum(seconds)), 4),
+    }
+
+def summarize_output(results):
+    """
+    Share of outputs that are not valid JSON, and generated tokens, streamed
+    chunks and request time per sample. Token means only cover samples with
+    Ollama's counters; samples stopped at the end of the JSON have none.
+    """
+    outputs = [r for r in results if not r.get("error")]
+    failures = 0
+    for r in outputs:
+        try:
+            json.loads(r.get("output") or "")
+        except ValueError:
+            failures += 1
+    metrics = [r["metrics"] for r in outputs if r.get("metrics")]
+    tokens = [m["eval_tokens"] for m in metrics if m.get("eval_tokens") is not None]
+    chunks = [m["eval_chunks"] for m in metrics if m.get("eval_chunks") is not None]
+    seconds = [m["total_s"] for m in metrics if m.get("total_s") is not None]
+    return {
+        "num_samples": len(outputs),
+        "parse_failures": failures,
+        "parse_failure_rate": round(failures / len(outputs), 4) if outputs else None,
+        "stopped_at_json_end": sum(m.get("done_reason") == "json_end" for m in metrics),
+        "counters_unavailable": sum(not m.get("counters_available", True) for m in metrics),
+        "eval_tokens_mean": round(float(np.mean(tokens)), 2) if tokens else None,
+        "eval_chunks_mean": round(float(np.mean(chunks)), 2) if chunks else None,
+        "total_s_mean": round(float(np.mean(seconds)), 4) if seconds else None,
+    }
+
+def mean_savings(baseline, current, fields):
+    """How much lower each `<field>_mean` of `current` is than in `baseline`, absolute and in percent."""
+    savings = {}
+    for field in fields:
+        before, after = baseline.get(f"{field}_mean"), current.get(f"{field}_mean")
+        if before and after is not None:
+            savings[f"{field}_saved"] = round(before - after, 4)
+            savings[f"{field}_saved_pct"] = round(100 * (before - after) / before, 1)
+    return savings
+
+def timestamped_path(prefix: str, output_dir: Path = Path("results")) -> Path:
+    """results/<prefix>_<Berlin timestamp>.json"""
+    timestamp = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%Y%m%d_%H%M%S")
+    return output_dir / f"{prefix}_{timestamp}.json"
+
 def save_experiment_metadata(metadata: ExperimentMetadata, output_dir: Path = Path("results")):
     """Save experiment metadata to JSON for report generation."""
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Create filename with timestamp
-    timestamp = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%Y%m%d_%H%M%S")
-    filename = f"metadata_{metadata.condition}_{timestamp}.json"
-    
-    filepath = output_dir / filename
+    filepath = timestamped_path(f"metadata_{metadata.condition}", output_dir)
     with open(filepath, "w") as f:
         json.dump(metadata.to_dict(), f, indent=2)
     
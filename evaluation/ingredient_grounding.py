@@ -0,0 +1,175 @@
+"""
+Ingredient grounding: how many generated ingredients are known ingredients.
+
+An IngredientIndex is built once from the case base (recipes.json). Each
+ingredient line is normalised to its name tokens (quantities, units,
+parentheticals, preparation notes and descriptors dropped, words
+singularised), tokens are interned to ids, and every normalised name goes
+into a trie keyed on the tokens in reverse order. Looking a generated line
+up walks that trie from its last token, so the longest vocabulary name
+ending in the line's head noun is found without any pairwise string
+comparison ("2 boneless chicken breasts, diced" -> "chicken breast").
+
+A line is grounded if it has such a match; the matched name's id is its
+canonical ingredient. Recipes are reduced to int bitsets of canonical ids,
+so the overlap with the retrieved reference recipe is one AND and two
+popcounts.
+
+Usage:
+    python evaluation/ingredient_grounding.py results/few_shot_RAG.json
+"""
+
+import re
+import sys
+import json
+import hashlib
+from pathlib import Path
+from functools import lru_cache
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.documents import normalize_recipe
+
+RECIPES_PATH = Path(__file__).parent.parent / "data/recipes.json"
+
+UNITS = {
+    "cup", "tablespoon", "tbsp", "tbs", "tb", "teaspoon", "tsp", "ounce", "oz", "pound", "lb", "gram", "g", "kg",
+    "kilogram", "ml", "milliliter", "l", "liter", "litre", "pint", "quart", "gallon", "qt", "pt", "c", "t",
+    "package", "pkg", "pkt", "packet", "can", "jar", "bottle", "box", "bag", "container", "carton", "envelope",
+    "stick", "slice", "piece", "clove", "head", "bunch", "sprig", "stalk", "pinch", "dash", "drop", "handful",
+    "inch", "whole", "half", "quarter", "dozen", "x",
+}
+DESCRIPTORS = {
+    "large", "small", "medium", "fresh", "freshly", "dried", "frozen", "thawed", "chopped", "minced", "sliced",
+    "diced", "grated", "shredded", "crushed", "ground", "softened", "melted", "cooked", "uncooked", "raw",
+    "drained", "rinsed", "peeled", "seeded", "halved", "cubed", "finely", "coarsely", "roughly", "thinly",
+    "thin", "thick", "lightly", "packed", "boneless", "skinless", "optional", "about", "approximately", "plus",
+    "more", "extra", "to", "taste", "for", "of", "and", "or", "a", "an", "the", "into", "cut", "cold", "warm",
+    "hot", "room", "temperature", "divided", "beaten", "sifted", "trimmed", "washed", "good", "quality",
+    "fine", "coarse", "lean", "low", "fat", "reduced", "sodium", "light", "firm", "ripe", "bite", "size",
+}
+
+_PARENS = re.compile(r"\([^)]*\)")
+_NON_LETTERS = re.compile(r"[^a-z]+")
+
+def singular(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("oes"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+def normalize_ingredient(line):
+    """Name tokens of an ingredient line: "1 (8 oz) package Cream Cheese, softened" -> ("cream", "cheese")."""
+    text = _PARENS.sub(" ", str(line).lower()).split(",")[0]
+    tokens = (singular(token) for token in _NON_LETTERS.split(text) if token)
+    return tuple(token for token in tokens if token not in UNITS and token not in DESCRIPTORS)
+
+class IngredientIndex:
+    """Interned ingredient vocabulary with a reversed-token trie and per-recipe id bitsets."""
+
+    def __init__(self):
+        self.token_ids = {}  # token -> interned id
+        self.names = []  # ingredient id -> name
+        self.trie = {}  # nested {token id: node}; a node's None key holds the ingredient id ending there
+        self.recipe_bits = {}  # dish_id -> bitset of the recipe's canonical ingredient ids
+        self.digest = None  # hash of the source file, for memo keys
+
+    @classmethod
+    def build(cls, recipes, digest=None):
+        index = cls()
+        index.digest = digest
+        for recipe in recipes:
+            for line in recipe.get("ingredients", []):
+                index.add(normalize_ingredient(line))
+        for recipe in recipes:
+            _, bits = index.ingredient_bits(recipe.get("ingredients", []))
+            index.recipe_bits[str(recipe.get("dish_id", ""))] = bits
+        return index
+
+    def add(self, tokens):
+        """Intern a normalised name; returns its ingredient id (None for an empty name)."""
+        if not tokens:
+            return None
+        node = self.trie
+        for token in reversed(tokens):
+            token_id = self.token_ids.setdefault(token, len(self.token_ids))
+            node = node.setdefault(token_id, {})
+        if None not in node:
+            node[None] = len(self.names)
+            self.names.append(" ".join(tokens))
+        return node[None]
+
+    def match(self, line):
+        """Id of the longest vocabulary name the line ends in, or None if the line is not grounded."""
+        node, found = self.trie, None
+        for token in reversed(normalize_ingredient(line)):
+            token_id = self.token_ids.get(token)
+            if token_id is None:
+                break
+            node = node.get(token_id)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def ingredient_bits(self, ingredients):
+        """(number of grounded lines, bitset of their ingredient ids)."""
+        grounded, bits = 0, 0
+        for line in ingredients:
+            ingredient_id = self.match(line)
+            if ingredient_id is not None:
+                grounded += 1
+                bits |= 1 << ingredient_id
+        return grounded, bits
+
+    def score(self, ingredients, reference_id=None):
+        """
+        (grounded fraction, reference overlap) of a generated ingredient list.
+        The overlap is the share of its distinct grounded ingredients that the
+        reference recipe also uses; None without a known reference.
+        """
+        if not ingredients:
+            return None, None
+        grounded, bits = self.ingredient_bits(ingredients)
+        overlap = None
+        reference = self.recipe_bits.get(str(reference_id)) if reference_id is not None else None
+        if reference is not None and bits:
+            # bin().count rather than int.bit_count, which needs Python 3.10
+            overlap = bin(bits & reference).count("1") / bin(bits).count("1")
+        return grounded / len(ingredients), overlap
+
+@lru_cache(maxsize=None)
+def load_index(path=RECIPES_PATH):
+    """Index of the case base at `path`, built once per process."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    recipes = [normalize_recipe(r) for r in json.loads(data)["recipes"]]
+    return IngredientIndex.build(recipes, digest=hashlib.sha256(data).hexdigest())
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score ingredient grounding of a results file")
+    parser.add_argument("results", type=Path, help="Aggregate results JSON")
+    parser.add_argument("--recipes", type=Path, default=RECIPES_PATH)
+    args = parser.parse_args()
+
+    index = load_index(args.recipes)
+    print(f"Vocabulary: {len(index.names)} ingredients, {len(index.token_ids)} tokens")
+    with open(args.results, "r") as f:
+        results = json.load(f)["results"]
+    for result in results:
+        try:
+            ingredients = json.loads(result.get("output") or "").get("ingredients", [])
+        except (ValueError, AttributeError):
+            print(f"{result.get('dish_name')}: unparseable output")
+            continue
+        grounded, overlap = index.score(ingredients, result.get("retrieved_recipe_id"))
+        overlap = f"{overlap:.2f}" if overlap is not None else "n/a"
+        print(f"{result.get('dish_name')}: grounded {grounded if grounded is not None else 0:.2f}, "
+              f"reference overlap {overlap}")
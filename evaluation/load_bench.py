@@ -0,0 +1,203 @@
+"""
+Offline end-to-end load benchmark of the experiment pipeline.
+
+Starts the fake Ollama server (generation/fake_ollama.py) in-process, points
+the Ollama client at it and runs `run_experiment_with_logging` for every
+combination of condition, dataset size and concurrency level, with the
+response cache off and profiling on. Runs happen inside a scratch working
+directory so the real results/ files are left alone. The few-shot RAG
+condition uses a canned retriever (recipes.json rows in turn) so no
+embedding model is needed.
+
+Per run it reports pipeline throughput, engine queueing delay (waiting for
+a free concurrency slot), server-side queueing (client time minus the
+server's own total), and where the non-LLM time goes: wall time outside any
+in-flight LLM call, broken down by profiled stage.
+
+Usage:
+    python evaluation/load_bench.py --sizes 10 50 --concurrency 1 4 8 --token-rate 200
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from pathlib import Path
+from contextlib import contextmanager
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation.run_experiments import run_experiment_with_logging
+from evaluation.profiler import PROFILER
+from generation.fake_ollama import (start_server, load_canned_outputs, DEFAULT_LATENCY, DEFAULT_PROMPT_RATE,
+                                    DEFAULT_TOKEN_RATE, DEFAULT_ERROR_RATE, DEFAULT_PARALLEL)
+from retrieval.recipe_retriever import RecipeRetriever
+from retrieval.documents import normalize_recipe
+
+PROJECT_ROOT = Path(__file__).parent.parent
+RECIPES_PATH = PROJECT_ROOT / "data/recipes.json"
+WORK_DIR = Path("results/load_bench")
+
+DEFAULT_SIZES = (10, 50)
+DEFAULT_CONCURRENCY_LEVELS = (1, 4, 8)
+CONDITIONS = ("zero_shot", "few_shot_RAG")
+
+def load_recipes(path=RECIPES_PATH):
+    with open(path, "r") as f:
+        return [normalize_recipe(r) for r in json.load(f)["recipes"]]
+
+def dish_names(count, recipes):
+    """`count` distinct dish names, cycling through the case base."""
+    names = [r.get("dish_name") or r.get("name") or "Dish" for r in recipes] or ["Dish"]
+    return [names[i % len(names)] + (f" #{i // len(names) + 1}" if i >= len(names) else "")
+            for i in range(count)]
+
+class CannedRetriever:
+    """Returns case-base recipes in turn; keeps the embedding model out of the load benchmark."""
+
+    format_recipe = RecipeRetriever.format_recipe
+
+    def __init__(self, recipes):
+        self.recipes = recipes
+
+    def retrieve_many(self, queries, k=1, mode="dense", filters=None):
+        return [
+            [(self.format_recipe(r), r.get("dish_id", ""), r.get("dish_name", ""))
+             for r in (self.recipes[(i + j) % len(self.recipes)] for j in range(k))]
+            for i, _ in enumerate(queries)
+        ]
+
+@contextmanager
+def working_directory(path):
+    path.mkdir(parents=True, exist_ok=True)
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def _union_seconds(intervals):
+    """Total length covered by possibly overlapping (start, end) intervals."""
+    covered, end = 0, None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            covered += stop - start
+            end = stop
+        elif stop > end:
+            covered += stop - end
+            end = stop
+    return covered / 1e9
+
+def overhead_breakdown(events, wall_s):
+    """Wall time outside in-flight LLM calls, and the non-LLM stages that fill it."""
+    llm = [(start, start + duration) for name, _, start, duration, _, _ in events if name == "llm.generate"]
+    llm_wall_s = _union_seconds(llm)
+    stages = {}
+    for name, _, _, duration, _, _ in events:
+        if name != "llm.generate" and not name.startswith("experiment."):
+            stages[name] = stages.get(name, 0.0) + duration / 1e9
+    return {
+        "llm_wall_s": round(llm_wall_s, 4),
+        "non_llm_wall_s": round(max(0.0, wall_s - llm_wall_s), 4),
+        "stages_s": {name: round(seconds, 4) for name, seconds in sorted(stages.items(), key=lambda s: -s[1])},
+    }
+
+def _p(values, q):
+    return round(float(np.percentile(values, q)), 4) if values else None
+
+def run_load_bench(sizes=DEFAULT_SIZES, concurrency_levels=DEFAULT_CONCURRENCY_LEVELS, conditions=CONDITIONS,
+                  work_dir=WORK_DIR, shared_prefix=False, structured=False, **server_config):
+    """Run every (condition, size, concurrency) combination against a fresh fake server."""
+    recipes = load_recipes()
+    server = start_server(outputs=load_canned_outputs(RECIPES_PATH), **server_config)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    retriever = CannedRetriever(recipes)
+
+    runs = []
+    try:
+        with working_directory(Path(work_dir)):
+            for condition in conditions:
+                for size in sizes:
+                    dishes = dish_names(size, recipes)
+                    for concurrency in concurrency_levels:
+                        print(f"🚀 {condition}: {size} samples at concurrency {concurrency}")
+                        metadata = run_experiment_with_logging(
+                            condition, concurrency=concurrency, use_cache=False, profile=True,
+                            dishes=dishes, retriever=retriever if condition == "few_shot_RAG" else None,
+                            shared_prefix=shared_prefix, structured=structured,
+                        )
+                        with open(f"results/{condition}.json", "r") as f:
+                            results = json.load(f)["results"]
+                        metrics = [r["metrics"] for r in results if r.get("metrics")]
+                        queue = [m["queue_s"] for m in metrics if m.get("queue_s") is not None]
+                        server_wait = [m["total_s"] - m["server_s"] for m in metrics
+                                       if m.get("total_s") is not None and m.get("server_s") is not None]
+                        wall_s = metadata.total_duration_seconds
+                        runs.append({
+                            "condition": condition,
+                            "samples": size,
+                            "concurrency": concurrency,
+                            "errors": sum(1 for r in results if r.get("error")),
+                            "wall_s": round(wall_s, 4),
+                            "throughput_per_s": round(size / wall_s, 3),
+                            "engine_queue_s": {"p50": _p(queue, 50), "p95": _p(queue, 95)},
+                            "server_queue_s": {"p50": _p(server_wait, 50), "p95": _p(server_wait, 95)},
+                            "latency": metadata.latency,
+                            "prompt_eval": metadata.prompt_eval,
+                            "output": metadata.output_stats,
+                            "overhead": overhead_breakdown(PROFILER.events, wall_s),
+                        })
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "server": dict(server_config, requests=server.requests, injected_errors=server.errors,
+                       cancelled=server.cancelled),
+        "runs": runs,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the generation pipeline against a fake Ollama server")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Samples per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY_LEVELS)
+    parser.add_argument("--conditions", nargs="+", choices=CONDITIONS, default=CONDITIONS)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY)
+    parser.add_argument("--prompt-rate", type=float, default=DEFAULT_PROMPT_RATE)
+    parser.add_argument("--token-rate", type=float, default=DEFAULT_TOKEN_RATE)
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_ERROR_RATE)
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL,
+                        help="Fake server slots, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--shared-prefix", action="store_true",
+                        help="Use the shared-prefix prompt layout (compared with earlier inline runs in --work-dir)")
+    parser.add_argument("--structured", action="store_true",
+                        help="JSON-constrained output stopped at the closing brace (compared with earlier "
+                             "unconstrained runs in --work-dir)")
+    parser.add_argument("--work-dir", type=Path, default=WORK_DIR)
+    parser.add_argument("--output", type=Path, default=Path("results/load_bench.json"))
+    args = parser.parse_args()
+    if args.shared_prefix and args.structured:
+        parser.error("--shared-prefix and --structured can't be combined (no prompt-eval counters "
+                     "for structured runs)")
+
+    output = args.output.resolve()
+    report = run_load_bench(args.sizes, args.concurrency, args.conditions, args.work_dir,
+                           args.shared_prefix, args.structured,
+                           latency=args.latency, prompt_rate=args.prompt_rate, token_rate=args.token_rate,
+                           error_rate=args.error_rate, parallel=args.parallel)
+
+    print(f"\n{'condition':<13} {'n':>5} {'conc':>5} {'wall s':>8} {'per s':>7} {'queue p50':>10} "
+          f"{'srv queue p50':>14} {'non-LLM s':>10} {'errors':>7}")
+    for run in report["runs"]:
+        print(f"{run['condition']:<13} {run['samples']:>5} {run['concurrency']:>5} {run['wall_s']:>8.2f} "
+              f"{run['throughput_per_s']:>7.2f} {run['engine_queue_s']['p50'] or 0:>10.3f} "
+              f"{run['server_queue_s']['p50'] or 0:>14.3f} {run['overhead']['non_llm_wall_s']:>10.3f} "
+              f"{run['errors']:>7}")
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nLoad benchmark report saved to {output}")
@@ -3,10 +3,32 @@ Metrics calculation and comparison for report generation.
 Compares zero-shot vs RAG-enhanced recipe generation.
 """
 
+import os
+import sys
 import json
+import hashlib
+import numpy as np
 from pathlib import Path
 from typing import Dict, List
 from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation.profiler import span, profiled
+from evaluation.ingredient_grounding import load_index, RECIPES_PATH
+from retrieval.documents import categorize_recipe
+from generation.result_sink import iter_results
+
+METRICS_VERSION = 2  # part of the memo key; bump when the per-recipe metrics change
+METRICS_CACHE_DIR = Path("results/metrics_cache")
+PARSE_CHUNK_SIZE = 2048  # results per process-pool task
+QUANTILES = (5, 25, 50, 75, 95)
+
+_MEMO = {}  # content hash -> columns, for files already parsed in this process
+_GROUNDING_INDEX = None  # IngredientIndex used by _parse_chunk, set per process
 
 @dataclass
 class RecipeMetrics:
@@ -16,89 +38,266 @@ class RecipeMetrics:
     num_steps: int
     has_json_error: bool = False  # if output couldn't be parsed
     error_message: str = None
+    category: str = None
+    grounded_fraction: float = None  # share of ingredients found in the case-base vocabulary
+    reference_overlap: float = None  # share of grounded ingredients also in the retrieved recipe
+
+def result_category(result):
+    """The result's own category, else the case-base category its dish name falls into."""
+    if result.get("category"):
+        return result["category"]
+    return categorize_recipe(result.get("dish_name", ""))
+
+def _set_grounding_index(index):
+    global _GROUNDING_INDEX
+    _GROUNDING_INDEX = index
+
+def _parse_chunk(chunk):
+    """
+    Metrics rows (num_ingredients, num_steps, error message or "", grounded
+    fraction, reference overlap) for (raw output, retrieved recipe id) items;
+    grounding scores are NaN where they do not apply.
+    """
+    rows = []
+    for output, reference_id in chunk:
+        try:
+            parsed = json.loads(output)
+            ingredients = parsed.get("ingredients", [])
+            steps = parsed.get("steps", [])
+        except (ValueError, TypeError, AttributeError) as e:
+            rows.append((0, 0, str(e) or type(e).__name__, np.nan, np.nan))
+            continue
+        grounded = overlap = None
+        if _GROUNDING_INDEX is not None and isinstance(ingredients, list):
+            grounded, overlap = _GROUNDING_INDEX.score(ingredients, reference_id)
+        rows.append((len(ingredients), len(steps), "",
+                     np.nan if grounded is None else grounded, np.nan if overlap is None else overlap))
+    return rows
+
+def file_hash(path, *extra):
+    """sha256 of the file contents, METRICS_VERSION and any `extra` strings."""
+    digest = hashlib.sha256(f"metrics-v{METRICS_VERSION}".encode("utf-8"))
+    for value in extra:
+        digest.update(str(value).encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 class MetricsCalculator:
-    """Calculate metrics from generation results."""
+    """
+    Calculate metrics from generation results.
+
+    By default the results JSON is loaded whole. With stream=True a .json
+    or .jsonl file is read incrementally, outputs are parsed on `workers`
+    processes in PARSE_CHUNK_SIZE batches, and only the per-recipe metric
+    columns (NumPy arrays) are kept. Columns are memoised by file content
+    hash in-process and, with `cache_dir`, on disk.
+
+    With `grounding` (and data/recipes.json present) every recipe is also
+    scored against the case-base ingredient index, see ingredient_grounding.py.
+    """
     
-    def __init__(self, results_file: Path):
-        """Load results from JSON file."""
-        with open(results_file, "r") as f:
-            self.results = json.load(f)
-        self.condition = self.results.get("condition", "unknown")
+    def __init__(self, results_file: Path, stream: bool = False, workers: int = 1, cache_dir: Path = None,
+                 grounding: bool = True):
+        """Load results from a JSON (or, streaming, JSONL) file."""
+        self.results_file = Path(results_file)
+        self.workers = workers
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.index = load_index() if grounding and RECIPES_PATH.exists() else None
+        self._summary = None
+        if stream:
+            self.results = None
+            self.header = {}
+            with span("metrics.load", file=str(results_file), stream=True):
+                self._load_columns()
+        else:
+            with span("metrics.load", file=str(results_file)), open(results_file, "r") as f:
+                self.results = json.load(f)
+            self.header = {k: v for k, v in self.results.items() if k != "results"}
+            self._columns_from(self.results.get("results", []))
+        self.condition = self.header.get("condition", "unknown")
+
+    def _load_columns(self):
+        key = file_hash(self.results_file, self.index.digest if self.index is not None else "")
+        cache_path = self.cache_dir / f"{key}.npz" if self.cache_dir else None
+        if key in _MEMO:
+            columns = _MEMO[key]
+        elif cache_path is not None and cache_path.exists():
+            with np.load(cache_path) as data:
+                columns = {name: data[name] for name in data.files}
+            columns["header"] = json.loads(str(columns["header"]))
+        else:
+            self._columns_from(iter_results(self.results_file, self.header),
+                               dedupe=self.results_file.suffix == ".jsonl")
+            columns = self._columns()
+            if cache_path is not None:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                np.savez(cache_path, **dict(columns, header=np.array(json.dumps(columns["header"]))))
+        _MEMO[key] = columns
+        self._set_columns(columns)
+
+    def _columns_from(self, results, dedupe=False):
+        """Parse outputs into columns; with `dedupe` the last result per dish wins, as in jsonl_to_json."""
+        names, categories, rows = [], [], []
+
+        def outputs():
+            for result in results:
+                names.append(result.get("dish_name", "unknown"))
+                categories.append(result_category(result))
+                yield result.get("output", "{}"), result.get("retrieved_recipe_id")
+
+        _set_grounding_index(self.index)
+        chunks = _chunks(outputs(), PARSE_CHUNK_SIZE)
+        first = next(chunks, None)
+        if first is not None:
+            rows.extend(_parse_chunk(first))
+        # The pool only starts once there is more than one chunk, and at most
+        # 2 x workers chunks are in flight, so memory stays bounded
+        if self.workers > 1 and first is not None and len(first) == PARSE_CHUNK_SIZE:
+            with ProcessPoolExecutor(self.workers, initializer=_set_grounding_index,
+                                     initargs=(self.index,)) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(_parse_chunk, chunk))
+                    if len(pending) >= 2 * self.workers:
+                        rows.extend(pending.popleft().result())
+                while pending:
+                    rows.extend(pending.popleft().result())
+        else:
+            for chunk in chunks:
+                rows.extend(_parse_chunk(chunk))
+
+        keep = range(len(names))
+        if dedupe:
+            keep = sorted({name: i for i, name in enumerate(names)}.values())
+        self._set_columns({
+            "dish_names": np.array([names[i] for i in keep], dtype=str),
+            "categories": np.array([categories[i] for i in keep], dtype=str),
+            "num_ingredients": np.array([rows[i][0] for i in keep], dtype=np.int32),
+            "num_steps": np.array([rows[i][1] for i in keep], dtype=np.int32),
+            "errors": np.array([rows[i][2] for i in keep], dtype=str),
+            "grounded": np.array([rows[i][3] for i in keep], dtype=np.float32),
+            "reference_overlap": np.array([rows[i][4] for i in keep], dtype=np.float32),
+            "header": dict(self.header),
+        })
+
+    def _set_columns(self, columns):
+        self.dish_names = columns["dish_names"]
+        self.categories = columns["categories"]
+        self.num_ingredients = columns["num_ingredients"]
+        self.num_steps = columns["num_steps"]
+        self.errors = columns["errors"]
+        self.grounded = columns["grounded"]
+        self.reference_overlap = columns["reference_overlap"]
+        self.json_errors = self.errors != ""
+        self.header = columns["header"]
+
+    def _columns(self):
+        return {"dish_names": self.dish_names, "categories": self.categories,
+                "num_ingredients": self.num_ingredients, "num_steps": self.num_steps,
+                "errors": self.errors, "grounded": self.grounded,
+                "reference_overlap": self.reference_overlap, "header": self.header}
     
+    @profiled("metrics.recipe_metrics")
     def calculate_recipe_metrics(self) -> List[RecipeMetrics]:
         """Extract and calculate metrics for each recipe."""
-        metrics = []
-        
-        for result in self.results.get("results", []):
-            dish_name = result.get("dish_name", "unknown")
-            output = result.get("output", "{}")
-            
-            try:
-                # Parse JSON output
-                parsed = json.loads(output)
-                ingredients = parsed.get("ingredients", [])
-                steps = parsed.get("steps", [])
-                
-                metric = RecipeMetrics(
-                    dish_name=dish_name,
-                    num_ingredients=len(ingredients),
-                    num_steps=len(steps),
-                    has_json_error=False
-                )
-            except (json.JSONDecodeError, ValueError) as e:
-                metric = RecipeMetrics(
-                    dish_name=dish_name,
-                    num_ingredients=0,
-                    num_steps=0,
-                    has_json_error=True,
-                    error_message=str(e)
-                )
-            
-            metrics.append(metric)
-        
-        return metrics
+        return [
+            RecipeMetrics(
+                dish_name=str(name),
+                num_ingredients=int(ingredients),
+                num_steps=int(steps),
+                has_json_error=bool(error),
+                error_message=str(error) or None,
+                category=str(category),
+                grounded_fraction=None if np.isnan(grounded) else float(grounded),
+                reference_overlap=None if np.isnan(overlap) else float(overlap),
+            )
+            for name, ingredients, steps, error, category, grounded, overlap in zip(
+                self.dish_names, self.num_ingredients, self.num_steps, self.errors, self.categories,
+                self.grounded, self.reference_overlap)
+        ]
     
+    @profiled("metrics.summary")
     def get_summary_stats(self) -> Dict:
-        """Get summary statistics."""
-        metrics = self.calculate_recipe_metrics()
-        
-        valid_metrics = [m for m in metrics if not m.has_json_error]
-        error_count = len([m for m in metrics if m.has_json_error])
-        
-        if not valid_metrics:
-            return {
-                "condition": self.condition,
-                "total_recipes": len(metrics),
-                "parsing_errors": error_count,
-                "valid_recipes": 0,
-                "avg_ingredients": 0,
-                "avg_steps": 0
+        """Get summary statistics, with quantiles and a per-category breakdown."""
+        if self._summary is None:
+            self._summary = {"condition": self.condition,
+                             **_column_stats(self.num_ingredients, self.num_steps, self.json_errors,
+                                             self.grounded, self.reference_overlap, quantiles=True)}
+            # One stable sort groups the row indices of every category
+            labels, inverse = np.unique(self.categories, return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(labels)))[:-1])
+            self._summary["by_category"] = {
+                str(label): _column_stats(self.num_ingredients[rows], self.num_steps[rows], self.json_errors[rows],
+                                          self.grounded[rows], self.reference_overlap[rows])
+                for label, rows in zip(labels, groups)
             }
-        
-        avg_ingredients = sum(m.num_ingredients for m in valid_metrics) / len(valid_metrics)
-        avg_steps = sum(m.num_steps for m in valid_metrics) / len(valid_metrics)
-        
-        return {
-            "condition": self.condition,
-            "total_recipes": len(metrics),
-            "parsing_errors": error_count,
-            "valid_recipes": len(valid_metrics),
-            "avg_ingredients": round(avg_ingredients, 2),
-            "avg_steps": round(avg_steps, 2),
-            "min_ingredients": min(m.num_ingredients for m in valid_metrics),
-            "max_ingredients": max(m.num_ingredients for m in valid_metrics),
-            "min_steps": min(m.num_steps for m in valid_metrics),
-            "max_steps": max(m.num_steps for m in valid_metrics)
-        }
+        return self._summary
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _column_stats(ingredients, steps, json_errors, grounded, reference_overlap, quantiles=False):
+    """Counts, ingredient/step statistics and grounding scores over the recipes that parsed."""
+    valid = ~json_errors
+    stats = {
+        "total_recipes": int(len(json_errors)),
+        "parsing_errors": int(json_errors.sum()),
+        "valid_recipes": int(valid.sum()),
+    }
+    if not valid.any():
+        return dict(stats, avg_ingredients=0, avg_steps=0)
 
-def compare_conditions(zero_shot_file: Path, rag_file: Path) -> Dict:
-    """Compare metrics between zero-shot and RAG conditions."""
-    calc_zero = MetricsCalculator(zero_shot_file)
-    calc_rag = MetricsCalculator(rag_file)
+    for name, values in (("ingredients", ingredients[valid]), ("steps", steps[valid])):
+        stats[f"avg_{name}"] = round(float(values.mean()), 2)
+        stats[f"min_{name}"] = int(values.min())
+        stats[f"max_{name}"] = int(values.max())
+        if quantiles:
+            stats[f"{name}_quantiles"] = {f"p{q}": float(v)
+                                          for q, v in zip(QUANTILES, np.percentile(values, QUANTILES))}
+
+    for name, values in (("grounded", grounded), ("reference_overlap", reference_overlap)):
+        values = values[~np.isnan(values)]
+        if len(values):
+            stats[f"avg_{name}"] = round(float(values.mean()), 4)
+            if quantiles:
+                stats[f"{name}_quantiles"] = {f"p{q}": round(float(v), 4)
+                                              for q, v in zip(QUANTILES, np.percentile(values, QUANTILES))}
+    return stats
+
+@profiled("metrics.compare")
+def compare_conditions(zero_shot_file: Path, rag_file: Path, semantic: bool = False, **calculator_kwargs) -> Dict:
+    """
+    Compare metrics between zero-shot and RAG conditions (kwargs go to MetricsCalculator).
+    With `semantic`, both runs also get embedding similarity to the case base.
+    """
+    calc_zero = MetricsCalculator(zero_shot_file, **calculator_kwargs)
+    calc_rag = MetricsCalculator(rag_file, **calculator_kwargs)
     
     stats_zero = calc_zero.get_summary_stats()
     stats_rag = calc_rag.get_summary_stats()
+    semantic_delta = None
+    if semantic:
+        from evaluation.semantic_similarity import SemanticSimilarityEvaluator
+        evaluator = SemanticSimilarityEvaluator()
+        stats_zero = {**stats_zero, "semantic_similarity": evaluator.evaluate(zero_shot_file)}
+        stats_rag = {**stats_rag, "semantic_similarity": evaluator.evaluate(rag_file)}
+        nearest_zero = stats_zero["semantic_similarity"].get("nearest_similarity")
+        nearest_rag = stats_rag["semantic_similarity"].get("nearest_similarity")
+        if nearest_zero and nearest_rag:
+            semantic_delta = round(nearest_rag["mean"] - nearest_zero["mean"], 4)
+    zero_by_category, rag_by_category = stats_zero["by_category"], stats_rag["by_category"]
+    shared = [c for c in zero_by_category
+              if zero_by_category[c]["valid_recipes"] and rag_by_category.get(c, {}).get("valid_recipes")]
     
     return {
         "zero_shot": stats_zero,
@@ -106,7 +305,15 @@ def compare_conditions(zero_shot_file: Path, rag_file: Path) -> Dict:
         "comparison": {
             "ingredient_delta": round(stats_rag["avg_ingredients"] - stats_zero["avg_ingredients"], 2),
             "step_delta": round(stats_rag["avg_steps"] - stats_zero["avg_steps"], 2),
-            "error_difference": stats_rag["parsing_errors"] - stats_zero["parsing_errors"]
+            "error_difference": stats_rag["parsing_errors"] - stats_zero["parsing_errors"],
+            "grounding_delta": (round(stats_rag["avg_grounded"] - stats_zero["avg_grounded"], 4)
+                                if "avg_grounded" in stats_rag and "avg_grounded" in stats_zero else None),
+            "rag_reference_overlap": stats_rag.get("avg_reference_overlap"),
+            "nearest_similarity_delta": semantic_delta,
+            "ingredient_delta_by_category": {
+                c: round(rag_by_category[c]["avg_ingredients"] - zero_by_category[c]["avg_ingredients"], 2)
+                for c in shared
+            },
         }
     }
 
@@ -120,11 +327,26 @@ def save_metrics_report(metrics_dict: Dict, output_path: Path = Path("results/me
 
 # Usage example
 if __name__ == "__main__":
-    zero_shot_path = Path("results/zero_shot.json")
-    rag_path = Path("results/few_shot_RAG.json")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare zero-shot and RAG result metrics")
+    parser.add_argument("--zero-shot", type=Path, default=Path("results/zero_shot.json"),
+                        help="Zero-shot results (.json, or .jsonl with --stream)")
+    parser.add_argument("--rag", type=Path, default=Path("results/few_shot_RAG.json"))
+    parser.add_argument("--stream", action="store_true",
+                        help="Read results incrementally and keep only NumPy metric columns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes parsing outputs in streaming mode")
+    parser.add_argument("--cache-dir", type=Path, default=METRICS_CACHE_DIR,
+                        help="Where streamed per-file metrics are memoised by content hash")
+    parser.add_argument("--semantic", action="store_true",
+                        help="Add embedding similarity to the case base (loads the retriever)")
+    args = parser.parse_args()
+    zero_shot_path, rag_path = args.zero_shot, args.rag
+    calculator_kwargs = {"stream": True, "workers": args.workers, "cache_dir": args.cache_dir} if args.stream else {}
     
     if zero_shot_path.exists() and rag_path.exists():
-        comparison = compare_conditions(zero_shot_path, rag_path)
+        comparison = compare_conditions(zero_shot_path, rag_path, semantic=args.semantic, **calculator_kwargs)
         save_metrics_report(comparison)
         
         print("\n" + "="*60)
@@ -0,0 +1,165 @@
+"""
+Lightweight nested span profiler for the experiment pipeline.
+
+    with span("retriever.encode_queries", n=len(queries)):
+        ...
+
+    @profiled("metrics.summary")
+    def get_summary_stats(self): ...
+
+Spans are only recorded while the profiler is enabled (ExperimentTimer
+enables it for profiled runs); otherwise `span` returns a shared no-op
+context manager and `profiled` wrappers call straight through. Spans nest
+per thread and per asyncio task, so concurrent LLM calls show up as
+separate lanes in the Chrome trace / Perfetto JSON written by
+`save_chrome_trace`.
+"""
+
+import os
+import json
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from pathlib import Path
+
+_parent = contextvars.ContextVar("profiler_parent", default=None)
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "parent", "start", "token")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.parent = _parent.get()
+        self.token = _parent.set(self.name)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = time.perf_counter_ns()
+        _parent.reset(self.token)
+        if exc_type is not None:
+            self.args = dict(self.args, error=exc_type.__name__)
+        self.profiler.events.append(
+            (self.name, self.parent, self.start, end - self.start, self.profiler._lane(), self.args)
+        )
+        return False
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lanes = {}
+        self._origin = time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.events = []
+        self._lanes = {}
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name, **args):
+        """Context manager timing one named stage; nested spans become children."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def profiled(self, name=None):
+        """Decorator form of span() for plain and async functions."""
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await fn(*args, **kwargs)
+                    with _Span(self, span_name, {}):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, span_name, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _lane(self):
+        """Small integer per thread / asyncio task, used as the trace tid."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = ("task", id(task)) if task is not None else ("thread", threading.get_ident())
+        if key not in self._lanes:
+            label = task.get_name() if task is not None else threading.current_thread().name
+            self._lanes[key] = (len(self._lanes), label)
+        return self._lanes[key][0]
+
+    def summary(self):
+        """Per-stage totals: count, total/mean/max seconds and the direct parent stage."""
+        stages = {}
+        for name, parent, _, duration, _, _ in self.events:
+            stage = stages.setdefault(name, {"parent": parent, "count": 0, "total_s": 0.0, "max_s": 0.0})
+            seconds = duration / 1e9
+            stage["count"] += 1
+            stage["total_s"] += seconds
+            stage["max_s"] = max(stage["max_s"], seconds)
+        for stage in stages.values():
+            stage["mean_s"] = round(stage["total_s"] / stage["count"], 6)
+            stage["total_s"] = round(stage["total_s"], 6)
+            stage["max_s"] = round(stage["max_s"], 6)
+        return dict(sorted(stages.items(), key=lambda item: -item[1]["total_s"]))
+
+    def chrome_trace(self):
+        """Events in the Chrome trace format (chrome://tracing, ui.perfetto.dev)."""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": label}}
+            for tid, label in self._lanes.values()
+        ]
+        for name, _, start, duration, tid, args in self.events:
+            events.append({
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self._origin) / 1e3,
+                "dur": duration / 1e3,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        print(f"Trace saved to: {path}")
+        return path
+
+PROFILER = Profiler()
+span = PROFILER.span
+profiled = PROFILER.profiled
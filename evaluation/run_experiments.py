@@ -3,6 +3,7 @@ Unified experiment runner for both zero-shot and RAG conditions.
 Collects timing, logging, and metrics for comprehensive report generation.
 """
 
+import os
 import json
 import sys
 from pathlib import Path
@@ -10,22 +11,44 @@ from pathlib import Path
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from evaluation.experiment_logger import ExperimentMetadata, ExperimentTimer, save_experiment_metadata
-from evaluation.metrics_calculator import MetricsCalculator, compare_conditions, save_metrics_report
-from generation.zero_shot import main as run_zero_shot, MODEL_NAME as ZS_MODEL, TEMPERATURE, MAX_TOKENS, DISHES
-from retrieval.recipe_retriever import RecipeRetriever
+from evaluation.experiment_logger import (ExperimentMetadata, ExperimentTimer, save_experiment_metadata,
+                                          summarize_latency, summarize_prompt_eval, summarize_output,
+                                          mean_savings, timestamped_path)
+from evaluation.profiler import PROFILER
+from evaluation.metrics_calculator import (MetricsCalculator, compare_conditions, save_metrics_report,
+                                           METRICS_CACHE_DIR)
+from generation.zero_shot import main as run_zero_shot, MODEL_NAME as ZS_MODEL, TEMPERATURE, MAX_TOKENS, SEED
+from generation.dishes import DISHES, load_dishes
+from generation.engine import DEFAULT_CONCURRENCY
 
-def run_experiment_with_logging(condition: str, num_samples: int = None):
+def run_experiment_with_logging(condition: str, num_samples: int = None,
+                                concurrency: int = DEFAULT_CONCURRENCY, use_cache: bool = True,
+                                resume: bool = False, profile: bool = False, dishes: list = None,
+                                retriever=None, shared_prefix: bool = False, structured: bool = False):
     """
     Run an experiment (zero-shot or RAG) with full logging.
     
     Args:
         condition: "zero_shot" or "few_shot_RAG"
         num_samples: number of samples (defaults to using all DISHES)
+        concurrency: maximum number of in-flight generation requests
+        use_cache: answer repeated (model, prompt, options, seed) requests from the response cache
+        resume: continue an interrupted run, skipping dishes already in its JSONL results file
+        profile: record per-stage spans into the metadata and write a Chrome trace
+        dishes: dish names to generate (defaults to DISHES)
+        retriever: retriever for few_shot_RAG (defaults to get_retriever())
+        shared_prefix: send the fixed instructions as a system prompt Ollama can reuse across requests
+        structured: constrain output to JSON and stop generating when the top-level object closes
     """
+    if shared_prefix and structured:
+        # Cancelled streams carry no prompt-eval counters, so the shared-prefix saving can't be measured
+        raise ValueError("shared_prefix and structured can't be combined: structured runs stop the stream "
+                         "before Ollama reports prompt-eval counters")
     
+    if dishes is None:
+        dishes = DISHES
     if num_samples is None:
-        num_samples = len(DISHES)
+        num_samples = len(dishes)
     
     # Prepare metadata
     if condition == "zero_shot":
@@ -37,10 +60,10 @@ def run_experiment_with_logging(condition: str, num_samples: int = None):
             max_tokens=MAX_TOKENS,
             retrieval_model=None,
             k_retrieval=None,
-            num_samples=num_samples
+            num_samples=num_samples,
+            seed=SEED
         )
     elif condition == "few_shot_RAG":
-        retriever = RecipeRetriever()
         metadata = ExperimentMetadata(
             experiment_name="Few-Shot RAG Recipe Generation",
             condition="few_shot_RAG",
@@ -49,25 +72,96 @@ def run_experiment_with_logging(condition: str, num_samples: int = None):
             max_tokens=MAX_TOKENS,
             retrieval_model="Alibaba-NLP/gte-large-en-v1.5",
             k_retrieval=1,
-            num_samples=num_samples
+            num_samples=num_samples,
+            seed=SEED
         )
     else:
         raise ValueError(f"Unknown condition: {condition}")
+    metadata.prompt_layout = "shared_prefix" if shared_prefix else "inline"
+    metadata.structured_output = structured
     
     # Run with timing
-    with ExperimentTimer(metadata) as timer:
+    # The retriever (local, or a client for the retrieval server if one is running) is
+    # constructed inside the timed block so its startup shows up in the profile
+    trace_path = timestamped_path(f"trace_{condition}") if profile else None
+    with ExperimentTimer(metadata, profile=profile, trace_path=trace_path) as timer:
         if condition == "zero_shot":
-            run_zero_shot()
+            outputs = run_zero_shot(concurrency=concurrency, use_cache=use_cache, resume=resume,
+                                    dishes=dishes, shared_prefix=shared_prefix, structured=structured)
         elif condition == "few_shot_RAG":
             from generation.few_shot_RAG import main as run_rag
-            run_rag()
+            outputs = run_rag(retriever=retriever, concurrency=concurrency, use_cache=use_cache,
+                              resume=resume, dishes=dishes, shared_prefix=shared_prefix, structured=structured)
+    metadata.response_cache = outputs.get("response_cache")
+    metadata.latency = summarize_latency(outputs["results"])
+    metadata.pipeline = outputs.get("pipeline")
+    metadata.prompt_eval = summarize_prompt_eval(outputs["results"])
+    metadata.output_stats = summarize_output(outputs["results"])
+    report_baseline_savings(metadata)
+    for field in ("ttft_s", "total_s", "tokens_per_sec"):
+        if field in metadata.latency:
+            stats = metadata.latency[field]
+            print(f"{field}: p50 {stats['p50']:.3f}  p95 {stats['p95']:.3f}  p99 {stats['p99']:.3f}")
+    if metadata.profile:
+        for name, stage in metadata.profile.items():
+            print(f"  {name:<28} {stage['count']:>5}x  {stage['total_s']:>9.3f}s total")
     
     # Save metadata
     save_experiment_metadata(metadata)
     
     return metadata
 
-def compare_experiment_results():
+def report_baseline_savings(metadata):
+    """
+    Compare a shared-prefix run's prompt eval with the latest inline run, and a
+    structured run's tokens and parse failures with the latest unconstrained
+    run, of the same condition and model; savings go into the metadata.
+    """
+    stats = metadata.output_stats
+    print(f"Parse failures: {stats['parse_failures']}/{stats['num_samples']}, "
+          f"{stats['stopped_at_json_end']} stopped at the end of the JSON object")
+
+    if metadata.prompt_layout == "shared_prefix":
+        path, baseline = find_baseline(metadata.condition, metadata.model, "prompt_eval", prompt_layout="inline",
+                                       structured_output=metadata.structured_output)
+        if baseline is None:
+            print("No inline-layout run of this condition to compare prompt eval against; "
+                  "run once without --shared-prefix")
+        else:
+            before, after = baseline["prompt_eval"], metadata.prompt_eval
+            savings = mean_savings(before, after, ("prompt_tokens", "prompt_eval_s"))
+            after["savings"] = dict(savings, baseline=str(path))
+            if "prompt_eval_s_saved" in savings:
+                print(f"Prompt eval: {before['prompt_eval_s_mean']:.3f}s -> {after['prompt_eval_s_mean']:.3f}s "
+                      f"per sample ({savings['prompt_eval_s_saved_pct']:.1f}% saved vs {path.name})")
+
+    if metadata.structured_output:
+        path, baseline = find_baseline(metadata.condition, metadata.model, "output_stats", structured_output=False,
+                                       prompt_layout=metadata.prompt_layout)
+        if baseline is None:
+            print("No unconstrained run of this condition to compare against; run once without --structured")
+        else:
+            before = baseline["output_stats"]
+            # Cancelled streams carry no token counts, so compare streamed chunks
+            savings = mean_savings(before, stats, ("eval_chunks", "total_s"))
+            stats["savings"] = dict(savings, baseline=str(path),
+                                    baseline_parse_failure_rate=before["parse_failure_rate"])
+            if "eval_chunks_saved" in savings:
+                print(f"Structured output: {savings['eval_chunks_saved']:.1f} streamed chunks "
+                      f"({savings['eval_chunks_saved_pct']:.1f}%) saved per sample, parse failure rate "
+                      f"{before['parse_failure_rate']:.1%} -> {stats['parse_failure_rate']:.1%} vs {path.name}")
+
+def find_baseline(condition, model, key, output_dir=Path("results"), **match):
+    """Most recent saved metadata for `condition` and `model` that has `key` and the `match` field values."""
+    for path in sorted(output_dir.glob(f"metadata_{condition}_*.json"), reverse=True):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if (data.get("model") == model and data.get(key)
+                and all(data.get(field) == value for field, value in match.items())):
+            return path, data
+    return None, None
+
+def compare_experiment_results(profile: bool = False, semantic: bool = False):
     """Compare zero-shot and RAG results and generate metrics report."""
     zero_shot_path = Path("results/zero_shot.json")
     rag_path = Path("results/few_shot_RAG.json")
@@ -81,7 +175,15 @@ def compare_experiment_results():
         return None
     
     print("\n📊 Comparing results...")
-    comparison = compare_conditions(zero_shot_path, rag_path)
+    if profile:
+        PROFILER.reset()
+        PROFILER.enable()
+    comparison = compare_conditions(zero_shot_path, rag_path, semantic=semantic, stream=True,
+                                    workers=os.cpu_count() or 1, cache_dir=METRICS_CACHE_DIR)
+    if profile:
+        PROFILER.disable()
+        comparison["profile"] = PROFILER.summary()
+        PROFILER.save_chrome_trace(timestamped_path("trace_metrics"))
     save_metrics_report(comparison)
     
     return comparison
@@ -94,16 +196,44 @@ if __name__ == "__main__":
                         default="both", help="Which condition to run")
     parser.add_argument("--compare", action="store_true", 
                         help="Compare results after running experiments")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of in-flight Ollama requests")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the LLM response cache and always call the model")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue interrupted runs from their JSONL results files")
+    parser.add_argument("--dishes", type=Path, default=None,
+                        help="Dish list file (.txt, .json, recipes .json or .sqlite); defaults to DISHES")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage timings and write Chrome trace files to results/")
+    parser.add_argument("--shared-prefix", action="store_true",
+                        help="Send the fixed instructions as a reusable system prompt and report the "
+                             "prompt-eval saving against the last inline run")
+    parser.add_argument("--structured", action="store_true",
+                        help="Constrain output to JSON, stop at the closing brace and report tokens saved "
+                             "and parse failures against the last unconstrained run")
+    parser.add_argument("--semantic", action="store_true",
+                        help="Add embedding similarity to the case base to the metrics report")
     
     args = parser.parse_args()
+    if args.shared_prefix and args.structured:
+        parser.error("--shared-prefix and --structured can't be combined: structured runs stop the stream "
+                     "before Ollama reports the prompt-eval counters the shared-prefix saving is measured with")
+    dishes = load_dishes(args.dishes) if args.dishes else None
     
     if args.condition in ["zero_shot", "both"]:
         print("🚀 Running zero-shot experiment...")
-        run_experiment_with_logging("zero_shot")
+        run_experiment_with_logging("zero_shot", concurrency=args.concurrency,
+                                    use_cache=not args.no_cache, resume=args.resume,
+                                    profile=args.profile, dishes=dishes,
+                                    shared_prefix=args.shared_prefix, structured=args.structured)
     
     if args.condition in ["few_shot_RAG", "both"]:
         print("🚀 Running few-shot RAG experiment...")
-        run_experiment_with_logging("few_shot_RAG")
+        run_experiment_with_logging("few_shot_RAG", concurrency=args.concurrency,
+                                    use_cache=not args.no_cache, resume=args.resume,
+                                    profile=args.profile, dishes=dishes,
+                                    shared_prefix=args.shared_prefix, structured=args.structured)
     
     if args.compare or args.condition == "both":
-        compare_experiment_results()
+        compare_experiment_results(profile=args.profile, semantic=args.semantic)
@@ -0,0 +1,236 @@
+"""
+Large-scale experiment scheduler.
+
+Reads dish lists from files (see generation/dishes.py), expands them into
+(dish, condition, seed, model) jobs and runs them on one shared pool of
+`concurrency` workers. Jobs are queued with the conditions interleaved per
+dish, so zero-shot and RAG requests are in flight side by side and see the
+same server conditions instead of running one condition after the other.
+
+Every (condition, model, seed) group streams into its own JSONL results
+file (with --resume support) and is converted to the usual aggregate JSON
+at the end; progress, throughput and ETA are printed as jobs complete.
+
+Usage:
+    python evaluation/scheduler.py --dishes data/recipes.json --seeds 42 43 --concurrency 8
+    python evaluation/scheduler.py --dishes data/recipepairs_glutenfree_eval.json --limit 200 --resume
+"""
+
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass
+from backports.zoneinfo import ZoneInfo
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation.experiment_logger import summarize_latency
+from generation import zero_shot, few_shot_RAG
+from generation.dishes import DISHES, load_dishes
+from generation.engine import AsyncGenerationEngine, DEFAULT_CONCURRENCY
+from generation.response_cache import ResponseCache
+from generation.result_sink import JSONLResultWriter, jsonl_to_json
+from retrieval.client import get_retriever
+
+CONDITIONS = ("zero_shot", "few_shot_RAG")
+OUTPUT_DIR = Path("results/scheduled")
+PROGRESS_INTERVAL = 5.0  # seconds between progress lines
+RETRIEVAL_BATCH_SIZE = 256
+
+@dataclass(frozen=True)
+class Job:
+    dish: str
+    condition: str
+    seed: int
+    model: str
+
+    @property
+    def group(self):
+        return (self.condition, self.model, self.seed)
+
+def expand_jobs(dishes, conditions=CONDITIONS, seeds=(zero_shot.SEED,), models=(zero_shot.MODEL_NAME,)):
+    """All jobs, ordered so that consecutive jobs rotate through the conditions."""
+    return [
+        Job(dish, condition, seed, model)
+        for dish in dishes
+        for model in models
+        for seed in seeds
+        for condition in conditions
+    ]
+
+def results_path(output_dir, condition, model, seed):
+    safe_model = model.replace(":", "-").replace("/", "-")
+    return Path(output_dir) / f"{condition}__{safe_model}__seed{seed}.jsonl"
+
+class Progress:
+    """Completed / total jobs with throughput and ETA, printed at most every PROGRESS_INTERVAL."""
+
+    def __init__(self, total, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.by_condition = {}
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def update(self, job, failed=False):
+        self.done += 1
+        self.errors += failed
+        self.by_condition[job.condition] = self.by_condition.get(job.condition, 0) + 1
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval or self.done == self.total:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        eta = (self.total - self.done) / rate if rate else float("inf")
+        minutes, seconds = divmod(int(eta), 60) if eta != float("inf") else (0, 0)
+        conditions = ", ".join(f"{c} {n}" for c, n in self.by_condition.items())
+        print(f"[{self.done:>{len(str(self.total))}}/{self.total}] {100 * self.done / self.total:5.1f}%  "
+              f"{rate:.2f} jobs/s  ETA {minutes}m{seconds:02d}s  ({conditions}; {self.errors} errors)")
+
+def retrieve_references(dishes, retriever=None):
+    """Reference recipe per dish for the RAG condition, retrieved in batches."""
+    retriever = retriever or get_retriever()
+    references = {}
+    for start in range(0, len(dishes), RETRIEVAL_BATCH_SIZE):
+        batch = dishes[start:start + RETRIEVAL_BATCH_SIZE]
+        for dish, retrieved in zip(batch, retriever.retrieve_many(batch, k=1)):
+            references[dish] = retrieved[0]
+        print(f"Retrieved references for {min(start + RETRIEVAL_BATCH_SIZE, len(dishes))}/{len(dishes)} dishes")
+    return references
+
+async def _run_jobs(jobs, references, sinks, concurrency, cache, progress):
+    async with AsyncGenerationEngine(zero_shot.MODEL_NAME, zero_shot.OPTIONS, concurrency=concurrency,
+                                     cache=cache, seed=zero_shot.SEED) as engine:
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        # A fixed pool of workers takes jobs in queue order, keeping the conditions interleaved
+        async def worker():
+            while not queue.empty():
+                job = queue.get_nowait()
+                if job.condition == "zero_shot":
+                    result = await zero_shot.generate_recipe(job.dish, engine, model=job.model, seed=job.seed)
+                else:
+                    result = await few_shot_RAG.generate_recipe((job.dish, references[job.dish]), engine,
+                                                                model=job.model, seed=job.seed)
+                result.update(model=job.model, seed=job.seed)
+                sinks[job.group].write(result)
+                progress.update(job, failed="error" in result)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+def run_schedule(dishes, conditions=CONDITIONS, seeds=(zero_shot.SEED,), models=(zero_shot.MODEL_NAME,),
+                 concurrency=DEFAULT_CONCURRENCY, use_cache=True, resume=False, output_dir=OUTPUT_DIR,
+                 retriever=None):
+    """Run every (dish, condition, seed, model) job and write per-group results plus a summary."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now(ZoneInfo("Europe/Berlin")).isoformat()
+    jobs = expand_jobs(dishes, conditions, seeds, models)
+
+    sinks = {}
+    for condition, model, seed in dict.fromkeys(job.group for job in jobs):
+        header = {
+            "version": "scheduled",
+            "condition": condition,
+            "model": model,
+            "temperature": zero_shot.TEMPERATURE,
+            "max_tokens": zero_shot.MAX_TOKENS,
+            "seed": seed,
+            "timestamp": timestamp,
+        }
+        sinks[(condition, model, seed)] = JSONLResultWriter(results_path(output_dir, condition, model, seed),
+                                                            header, resume=resume)
+    todo = [job for job in jobs if job.dish not in sinks[job.group].completed]
+    print(f"{len(jobs)} jobs ({len(dishes)} dishes x {len(conditions)} conditions x {len(seeds)} seeds "
+          f"x {len(models)} models), {len(jobs) - len(todo)} already done")
+
+    rag_dishes = list(dict.fromkeys(job.dish for job in todo if job.condition == "few_shot_RAG"))
+    references = retrieve_references(rag_dishes, retriever) if rag_dishes else {}
+
+    cache = ResponseCache() if use_cache else None
+    progress = Progress(len(todo))
+    start = time.perf_counter()
+    try:
+        if todo:
+            asyncio.run(_run_jobs(todo, references, sinks, concurrency, cache, progress))
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    duration = time.perf_counter() - start
+
+    groups = {}
+    for (condition, model, seed), sink in sinks.items():
+        outputs = jsonl_to_json(sink.path, order=dishes)
+        groups[sink.path.stem] = {
+            "condition": condition,
+            "model": model,
+            "seed": seed,
+            "results_file": str(sink.path.with_suffix(".json")),
+            "num_results": len(outputs["results"]),
+            "errors": sum(1 for r in outputs["results"] if r.get("error")),
+            "latency": summarize_latency(outputs["results"]),
+        }
+
+    summary = {
+        "timestamp": timestamp,
+        "num_dishes": len(dishes),
+        "conditions": list(conditions),
+        "seeds": list(seeds),
+        "models": list(models),
+        "concurrency": concurrency,
+        "jobs": len(jobs),
+        "jobs_run": len(todo),
+        "errors": progress.errors,
+        "duration_seconds": round(duration, 3),
+        "jobs_per_second": round(len(todo) / duration, 3) if duration else None,
+        "response_cache": cache.stats() if cache is not None else None,
+        "groups": groups,
+    }
+    if cache is not None:
+        cache.close()
+
+    summary_path = output_dir / "schedule_summary.json"
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nRan {len(todo)} jobs in {duration:.1f}s; summary saved to {summary_path}")
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Schedule generation jobs over dish lists, seeds and models")
+    parser.add_argument("--dishes", type=Path, nargs="+", default=None,
+                        help="Dish list files (.txt, .json, recipes .json or .sqlite); defaults to DISHES")
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N dishes")
+    parser.add_argument("--conditions", nargs="+", choices=CONDITIONS, default=CONDITIONS)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[zero_shot.SEED])
+    parser.add_argument("--models", nargs="+", default=[zero_shot.MODEL_NAME])
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Size of the shared worker pool (in-flight Ollama requests)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the LLM response cache and always call the model")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip jobs that already have a result in their JSONL file")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    if args.dishes:
+        dishes = list(dict.fromkeys(d for path in args.dishes for d in load_dishes(path)))
+    else:
+        dishes = DISHES
+    if args.limit:
+        dishes = dishes[:args.limit]
+
+    run_schedule(dishes, args.conditions, args.seeds, args.models, args.concurrency,
+                 use_cache=not args.no_cache, resume=args.resume, output_dir=args.output_dir)
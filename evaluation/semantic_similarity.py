@@ -0,0 +1,180 @@
+"""
+Semantic similarity of generated recipes to the case base.
+
+Each output is turned into the same kind of document the retriever embeds
+(dish name, ingredients, steps; the raw text if it does not parse), and all
+outputs of a run are encoded in ENCODE_CHUNK_SIZE batches with the
+retriever's embedding model. Output embeddings are kept in a memory-mapped
+EmbeddingStore keyed by the content hash of the document text, so comparing
+runs that share outputs encodes each text once and cached rows are read
+straight from the file. Reference vectors are read from
+`RecipeRetriever.doc_embeddings` by row, so case-base recipes are never
+re-encoded.
+
+Per output this gives the cosine similarity to its retrieved reference
+recipe (row-wise dot product of the two matrices) and to its nearest
+case-base recipe (the retriever's index, one matrix multiply per block).
+
+Usage:
+    python evaluation/semantic_similarity.py results/zero_shot.json results/few_shot_RAG.json
+"""
+
+import sys
+import json
+import numpy as np
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation.profiler import span
+from generation.result_sink import iter_results
+from retrieval.documents import build_document, document_key
+from retrieval.index import normalize
+from retrieval.embedding_store import EmbeddingStore, EmbeddingStoreWriter
+from retrieval.recipe_retriever import EMBEDDING_MODEL, COPY_BLOCK_SIZE, cache_fingerprint
+
+OUTPUT_STORE_PATH = Path("results/output_embeddings.emb")
+ENCODE_CHUNK_SIZE = 4096  # outputs per encode call
+ENCODE_BATCH_SIZE = 64  # sentence-transformers batch size within a call
+
+def output_document(dish_name, output):
+    """Retriever-style document for a generated recipe, or the raw output if it is not JSON."""
+    try:
+        parsed = json.loads(output)
+        return build_document({
+            "dish_name": dish_name,
+            "ingredients": [str(i) for i in parsed.get("ingredients", [])],
+            "steps": [str(s) for s in parsed.get("steps", [])],
+        })
+    except (ValueError, TypeError, AttributeError):
+        return f"{dish_name} {output}"
+
+def load_outputs(path):
+    """(dish_name, output, retrieved_recipe_id) per result; in JSONL files the last record per dish wins."""
+    latest = {}
+    for result in iter_results(path):
+        dish = result.get("dish_name", "unknown")
+        latest.pop(dish, None)
+        latest[dish] = (dish, result.get("output") or "", result.get("retrieved_recipe_id"))
+    return list(latest.values())
+
+class SemanticSimilarityEvaluator:
+    def __init__(self, retriever=None, store_path=OUTPUT_STORE_PATH, chunk_size=ENCODE_CHUNK_SIZE):
+        if retriever is None:
+            from retrieval.recipe_retriever import RecipeRetriever
+            retriever = RecipeRetriever()
+        self.retriever = retriever
+        self.store_path = Path(store_path)
+        self.chunk_size = chunk_size
+
+    def _open_store(self):
+        store = EmbeddingStore.open(self.store_path)
+        if store is not None and store.model != EMBEDDING_MODEL:
+            print(f"Output embeddings in {self.store_path} were built with {store.model}, re-encoding...")
+            return None
+        return store
+
+    def embed(self, documents):
+        """
+        Normalised embeddings of `documents`. Rows already in the output store
+        are read from it; the rest are encoded and the store is rewritten once
+        with them appended.
+        """
+        store = self._open_store()
+        stored_keys = store.keys() if store is not None else []
+        stored_rows = {key: row for row, key in enumerate(stored_keys)}
+        keys = [document_key(d) for d in documents]
+
+        hits = np.array([i for i, key in enumerate(keys) if key in stored_rows], dtype=np.int64)
+        positions = {}  # missing key -> (document, indices in `documents`)
+        for i, key in enumerate(keys):
+            if key not in stored_rows:
+                positions.setdefault(key, (documents[i], []))[1].append(i)
+
+        vectors = None
+        if len(hits):
+            vectors = np.empty((len(documents), store.dim), dtype=np.float32)
+            vectors[hits] = store[np.array([stored_rows[keys[i]] for i in hits])]
+        if not positions:
+            return vectors
+
+        missing = list(positions)
+        writer = None
+        for start in range(0, len(missing), self.chunk_size):
+            chunk = missing[start:start + self.chunk_size]
+            model = self.retriever.model
+            with span("similarity.encode_outputs", outputs=len(chunk)):
+                encoded = normalize(model.encode([positions[k][0] for k in chunk], batch_size=ENCODE_BATCH_SIZE,
+                                                 convert_to_numpy=True))
+            # Rounded like the stored rows, so a rerun gives the same scores
+            encoded = encoded.astype(np.float16).astype(np.float32)
+            if writer is None:
+                if vectors is None:
+                    vectors = np.empty((len(documents), encoded.shape[1]), dtype=np.float32)
+                writer = EmbeddingStoreWriter(self.store_path, len(stored_keys) + len(missing), encoded.shape[1],
+                                              EMBEDDING_MODEL)
+                for block in range(0, len(stored_keys), COPY_BLOCK_SIZE):
+                    rows = slice(block, min(block + COPY_BLOCK_SIZE, len(stored_keys)))
+                    writer.write(rows, store[rows])
+            rows = slice(len(stored_keys) + start, len(stored_keys) + start + len(chunk))
+            writer.write(rows, encoded)
+            for key, vector in zip(chunk, encoded):
+                vectors[positions[key][1]] = vector
+            print(f"Encoded {min(start + self.chunk_size, len(missing))}/{len(missing)} new outputs")
+
+        all_keys = stored_keys + missing
+        writer.set_keys(all_keys)
+        writer.close(cache_fingerprint(EMBEDDING_MODEL, all_keys))
+        return vectors
+
+    def score(self, outputs):
+        """
+        Per output: similarity to its retrieved reference (NaN without one)
+        and to its nearest case-base recipe, with that recipe's row.
+        """
+        if not outputs:
+            empty = np.empty(0, dtype=np.float32)
+            return empty, empty, np.empty(0, dtype=np.int64)
+        embeddings = self.embed([output_document(dish, output) for dish, output, _ in outputs])
+
+        dish_rows = self.retriever.dish_rows
+        rows = np.array([dish_rows.get(str(ref), -1) if ref is not None else -1 for _, _, ref in outputs])
+        reference = np.full(len(outputs), np.nan, dtype=np.float32)
+        has_reference = rows >= 0
+        if has_reference.any():
+            with span("similarity.reference"):
+                vectors = np.asarray(self.retriever.doc_embeddings[rows[has_reference]], dtype=np.float32)
+                reference[has_reference] = np.einsum("ij,ij->i", embeddings[has_reference], vectors)
+
+        with span("similarity.nearest"):
+            scores, ids = self.retriever.index.search_many(embeddings, 1)
+        nearest = np.array([s[0] for s in scores], dtype=np.float32)
+        nearest_rows = np.array([i[0] for i in ids], dtype=np.int64)
+        return reference, nearest, nearest_rows
+
+    def evaluate(self, results_file):
+        """Summary of reference and nearest-neighbour similarity for one results file."""
+        reference, nearest, _ = self.score(load_outputs(results_file))
+        summary = {"num_outputs": len(nearest)}
+        for name, values in (("reference_similarity", reference), ("nearest_similarity", nearest)):
+            values = values[~np.isnan(values)]
+            if len(values):
+                p50, p95 = np.percentile(values, (50, 95))
+                summary[name] = {"mean": round(float(values.mean()), 4), "p50": round(float(p50), 4),
+                                 "p95": round(float(p95), 4)}
+        return summary
+
+def semantic_similarity_report(results_files, retriever=None):
+    """{condition (file stem): evaluate() summary} with one shared evaluator and output store."""
+    evaluator = SemanticSimilarityEvaluator(retriever)
+    return {Path(path).stem: evaluator.evaluate(path) for path in results_files}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Semantic similarity of generated recipes to the case base")
+    parser.add_argument("results", type=Path, nargs="+", help="Results files (.json or .jsonl)")
+    args = parser.parse_args()
+
+    print(json.dumps(semantic_similarity_report(args.results), indent=2))
@@ -0,0 +1,35 @@
+"""
+Dish lists for the generation scripts and the experiment scheduler.
+
+`DISHES` is the small pilot list; `load_dishes` reads larger ones from a
+text file (one name per line), a JSON list of names, a recipes JSON file
+(recipes.json, recipepairs_glutenfree_eval.json) or a SQLite recipe store.
+"""
+
+import json
+from pathlib import Path
+
+DISHES = [
+    "Vegetarian Lasagne",
+    "Pepperoni Pizza",
+    "Chicken Burger"
+]
+
+def load_dishes(path, limit=None):
+    """Distinct dish names from `path`, in file order."""
+    path = Path(path)
+    if path.suffix == ".sqlite":
+        from retrieval.recipe_store import RecipeStore
+        names = [recipe.get("dish_name", "") for recipe in RecipeStore(path)]
+    elif path.suffix == ".json":
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data["recipes"]
+        names = [d if isinstance(d, str) else d.get("dish_name") or d.get("name", "") for d in data]
+    else:
+        with open(path, "r") as f:
+            names = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    dishes = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+    return dishes[:limit] if limit else dishes
@@ -0,0 +1,235 @@
+"""
+Concurrent generation engine on top of the Ollama async client.
+
+Requests run under a concurrency limit so the Ollama server's parallel
+slots (OLLAMA_NUM_PARALLEL) are kept busy, each attempt has a timeout, and
+transient failures are retried with exponential backoff. Callers gather
+their per-dish coroutines, so results come back in dish order regardless
+of completion order. With a ResponseCache attached, a request whose model
+digest, prompt, options and seed were seen before is answered from disk.
+
+Generations are streamed so the client can measure time to first token;
+`sample_metrics` combines that with Ollama's own eval/prompt-eval counters.
+
+`shared_prefix_kwargs` sends fixed instructions as the system prompt with
+the model kept alive: the rendered prompt then starts with the same tokens
+every time and Ollama reuses their KV cache instead of re-evaluating them.
+
+With `until_json_end` the stream is read through a JSONObjectScanner and
+cancelled as soon as the top-level object closes; the response then carries
+the object's text, the parsed object under "parsed" and done_reason
+"json_end". Ollama's final counters never arrive for a cancelled stream, so
+such responses have counters_available False and no token counts or
+durations. Streamed responses also record eval_chunks, the number of chunks
+received, which is comparable between cancelled and complete streams.
+"""
+
+import time
+import asyncio
+import random
+import httpx
+import ollama
+from generation.response_cache import cache_key
+from generation.json_stream import JSONObjectScanner
+from evaluation.profiler import span
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 300  # seconds per attempt
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0  # seconds before the first retry, doubled each time
+DEFAULT_KEEP_ALIVE = "30m"  # keeps the model, and the KV cache of a shared prefix, loaded between requests
+
+class GenerationError(Exception):
+    """A generation request failed on every attempt."""
+
+def shared_prefix_kwargs(system, keep_alive=DEFAULT_KEEP_ALIVE):
+    """generate() kwargs that send `system` as a stable prompt prefix Ollama can reuse."""
+    return {"system": system, "keep_alive": keep_alive}
+
+def structured_output_kwargs():
+    """generate() kwargs for JSON-constrained output, cut off when the top-level object closes."""
+    return {"format": "json", "until_json_end": True}
+
+def _is_retryable(error):
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError, httpx.TransportError))
+
+class AsyncGenerationEngine:
+    def __init__(self, model, options, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, host=None, cache=None, seed=None,
+                 stream=True):
+        self.model = model
+        self.seed = seed
+        self.options = dict(options) if seed is None else dict(options, seed=seed)
+        self.cache = cache
+        self.stream = stream
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.host = host
+        self._client = None
+        self._semaphore = None
+        self._digests = {}
+        self._digest_lock = None
+
+    async def __aenter__(self):
+        self._client = ollama.AsyncClient(host=self.host)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._digest_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._client = None
+
+    async def model_digest(self, model=None):
+        """Digest of the local model, so cache entries die with a re-pulled model."""
+        model = model or self.model
+        async with self._digest_lock:
+            if model not in self._digests:
+                self._digests[model] = model
+                try:
+                    for listed in (await self._client.list()).models:
+                        if listed.model in (model, f"{model}:latest"):
+                            self._digests[model] = f"{model}@{listed.digest}"
+                            break
+                except Exception as e:
+                    print(f"  could not look up model digest ({type(e).__name__}), "
+                          f"keying cache on model name")
+        return self._digests[model]
+
+    async def generate(self, prompt, model=None, seed=None, until_json_end=False, **kwargs):
+        """
+        Generate one completion; returns the Ollama response dict.
+        `model` and `seed` override the engine defaults for this request;
+        `until_json_end` stops at the end of the first top-level JSON object.
+        """
+        model = model or self.model
+        options = self.options if seed is None else dict(self.options, seed=seed)
+        key = None
+        if self.cache is not None:
+            seed = self.seed if seed is None else seed
+            # keep_alive only affects how long the model stays loaded, not the output
+            request = {name: value for name, value in kwargs.items() if name != "keep_alive"}
+            if until_json_end:
+                request["until_json_end"] = True
+            key = cache_key(await self.model_digest(model), prompt, options, seed, **request)
+            with span("llm.cache_lookup"):
+                cached = self.cache.get(key)
+            if cached is not None:
+                cached["cached"] = True
+                return cached
+
+        with span("llm.generate", prompt_chars=len(prompt)):
+            response = await self._generate(prompt, model, options, until_json_end, **kwargs)
+        if self.cache is not None:
+            self.cache.put(key, response)
+        return response
+
+    async def _generate(self, prompt, model, options, until_json_end=False, **kwargs):
+        queued = 0.0
+        for attempt in range(self.retries + 1):
+            try:
+                # The slot is only held while a request is in flight, not during backoff
+                wait_start = time.perf_counter()
+                async with self._semaphore:
+                    queued += time.perf_counter() - wait_start
+                    response = await asyncio.wait_for(
+                        self._request(prompt, model, options, until_json_end, **kwargs), timeout=self.timeout)
+                response["timings"]["queue_s"] = queued
+                return response
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.retries:
+                    raise GenerationError(f"{type(e).__name__}: {e}") from e
+                delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+                print(f"  retrying in {delay:.1f}s after {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+
+    async def _request(self, prompt, model, options, until_json_end=False, **kwargs):
+        """One attempt; the response dict gets client-side `timings` added."""
+        start = time.perf_counter()
+        scanner = JSONObjectScanner() if until_json_end else None
+        if not self.stream:
+            response = dict(await self._client.generate(model=model, prompt=prompt,
+                                                        options=options, **kwargs))
+            response["timings"] = {"ttft_s": None, "total_s": time.perf_counter() - start}
+            if scanner is not None:
+                scanner.feed(response["response"])
+                response["parsed"] = scanner.parse()
+            return response
+
+        pieces, final, ttft = [], {}, None
+        stream = await self._client.generate(model=model, prompt=prompt, options=options, stream=True, **kwargs)
+        async for chunk in stream:
+            chunk = dict(chunk)
+            if chunk.get("response"):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                pieces.append(chunk["response"])
+                if scanner is not None and scanner.feed(chunk["response"]):
+                    break
+            if chunk.get("done"):
+                final = chunk
+
+        if scanner is not None and scanner.closed:
+            # Closing the stream drops the connection, which makes Ollama stop generating
+            await stream.aclose()
+            response = {"model": model, "response": scanner.text(), "parsed": scanner.parse(),
+                        "done": True, "done_reason": "json_end", "eval_chunks": len(pieces),
+                        "counters_available": False}
+        else:
+            # The last chunk carries the counters; the text is spread over all of them
+            response = dict(final, response="".join(pieces), eval_chunks=len(pieces))
+            if scanner is not None:
+                response["parsed"] = None
+        response["timings"] = {"ttft_s": ttft, "total_s": time.perf_counter() - start}
+        return response
+
+    async def run_all(self, coroutine_fn, items):
+        """Run coroutine_fn(item, engine) for every item; results are returned in item order."""
+        return await asyncio.gather(*(coroutine_fn(item, self) for item in items))
+
+def _seconds(nanoseconds):
+    return nanoseconds / 1e9 if nanoseconds else None
+
+def sample_metrics(response, max_tokens=None):
+    """
+    Per-sample latency and throughput from a generate() response.
+    Durations are in seconds: queue_s is the wait for a free engine slot,
+    total_s the client-side request time and server_s Ollama's own total.
+    budget_used is the fraction of max_tokens generated. Responses whose
+    stream was cancelled have counters_available False and None for every
+    Ollama counter; eval_chunks is still recorded.
+    """
+    timings = response.get("timings") or {}
+    eval_count = response.get("eval_count")
+    eval_s = _seconds(response.get("eval_duration"))
+    prompt_eval_count = response.get("prompt_eval_count")
+    prompt_eval_s = _seconds(response.get("prompt_eval_duration"))
+    return {
+        "queue_s": timings.get("queue_s"),
+        "ttft_s": timings.get("ttft_s"),
+        "total_s": timings.get("total_s"),
+        "server_s": _seconds(response.get("total_duration")),
+        "load_s": _seconds(response.get("load_duration")),
+        "prompt_tokens": prompt_eval_count,
+        "prompt_eval_s": prompt_eval_s,
+        "prompt_tokens_per_sec": prompt_eval_count / prompt_eval_s if prompt_eval_count and prompt_eval_s else None,
+        "eval_tokens": eval_count,
+        "eval_chunks": response.get("eval_chunks"),
+        "eval_s": eval_s,
+        "tokens_per_sec": eval_count / eval_s if eval_count and eval_s else None,
+        "budget_used": eval_count / max_tokens if eval_count is not None and max_tokens else None,
+        "done_reason": response.get("done_reason"),
+        "counters_available": response.get("counters_available", True),
+        "cached": bool(response.get("cached")),
+    }
+
+def run_generation(coroutine_fn, items, model, options, **engine_kwargs):
+    """Synchronous entry point: run coroutine_fn over items with a fresh engine."""
+    async def _main():
+        async with AsyncGenerationEngine(model, options, **engine_kwargs) as engine:
+            return await engine.run_all(coroutine_fn, items)
+
+    return asyncio.run(_main())
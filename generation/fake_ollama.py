@@ -0,0 +1,226 @@
+"""
+Local stand-in for the Ollama HTTP API, for offline load testing.
+
+Implements POST /api/generate (streaming NDJSON and non-streaming) and
+GET /api/tags. Each request waits for one of `parallel` slots (like
+OLLAMA_NUM_PARALLEL), spends `latency` seconds plus prompt evaluation at
+`prompt_rate` tokens/s before the first token, then emits a canned JSON
+recipe at `token_rate` tokens/s, cut off at options.num_predict. A share
+`error_rate` of requests fails with HTTP 503 so retries are exercised.
+The eval/prompt-eval counters and durations mirror what Ollama reports; a
+system prompt seen before is treated as KV-cached and not re-evaluated.
+Unconstrained outputs end with a line of chatter after the JSON, and with
+format=json they end in a run of whitespace, the way real models tend to;
+a client that disconnects mid-stream cancels the generation.
+
+Usage:
+    python -m generation.fake_ollama --port 11435 --token-rate 50 --parallel 4
+    OLLAMA_HOST=http://127.0.0.1:11435 python generation/zero_shot.py
+"""
+
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PORT = 11435
+DEFAULT_LATENCY = 0.05  # seconds of fixed overhead before the first token
+DEFAULT_PROMPT_RATE = 2000.0  # prompt tokens evaluated per second
+DEFAULT_TOKEN_RATE = 100.0  # generated tokens per second
+DEFAULT_ERROR_RATE = 0.0
+DEFAULT_PARALLEL = 4
+RECIPES_PATH = Path("data/recipes.json")
+CHARS_PER_TOKEN = 4
+TRAILING_CHATTER = "\n\nEnjoy your homemade dish! Let me know if you would like any substitutions."
+JSON_TRAILING_WHITESPACE = "\n" + " " * 31  # 8 tokens of padding after the object in format=json mode
+
+FALLBACK_RECIPES = [
+    {"ingredients": ["2 cups flour", "1 cup water", "1 tsp salt"],
+     "steps": ["Mix the flour, water and salt.", "Knead for 10 minutes.", "Bake at 220C for 25 minutes."]},
+    {"ingredients": ["200 g pasta", "1 jar tomato sauce", "50 g parmesan"],
+     "steps": ["Boil the pasta.", "Warm the sauce.", "Toss together and top with parmesan."]},
+]
+
+def load_canned_outputs(path=RECIPES_PATH):
+    """JSON recipe outputs to answer with: recipes.json if present, else built-in ones."""
+    try:
+        with open(path, "r") as f:
+            recipes = json.load(f)["recipes"]
+    except (OSError, ValueError, KeyError):
+        recipes = FALLBACK_RECIPES
+    outputs = []
+    for recipe in recipes:
+        ingredients, steps = recipe.get("ingredients", []), recipe.get("steps", [])
+        if isinstance(ingredients, str):
+            ingredients = json.loads(ingredients)
+        if isinstance(steps, str):
+            steps = json.loads(steps)
+        outputs.append(json.dumps({"ingredients": ingredients, "steps": steps}))
+    return outputs or [json.dumps(r) for r in FALLBACK_RECIPES]
+
+def tokenize(text):
+    """Fixed-width pseudo tokens, so counts scale with text length like real ones."""
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=DEFAULT_LATENCY, prompt_rate=DEFAULT_PROMPT_RATE,
+                 token_rate=DEFAULT_TOKEN_RATE, error_rate=DEFAULT_ERROR_RATE,
+                 parallel=DEFAULT_PARALLEL, outputs=None, seed=0):
+        super().__init__(address, FakeOllamaHandler)
+        self.latency = latency
+        self.prompt_rate = prompt_rate
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.slots = threading.Semaphore(parallel)
+        self.outputs = outputs or load_canned_outputs()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.prefixes = set()  # system prompts whose KV cache a kept-alive model would still hold
+
+    def fail_next(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "fake", "model": "fake", "digest": "fake-ollama"}]})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "fake"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        server = self.server
+        if server.fail_next():
+            self._send_json(503, {"error": "server busy"})
+            return
+
+        prompt = body.get("prompt", "")
+        options = body.get("options") or {}
+        # The same prompt always gets the same canned recipe
+        output = server.outputs[zlib.crc32(prompt.encode("utf-8")) % len(server.outputs)]
+        output += JSON_TRAILING_WHITESPACE if body.get("format") else TRAILING_CHATTER
+        tokens = tokenize(output)
+        num_predict = options.get("num_predict")
+        done_reason = "stop"
+        if num_predict and len(tokens) > num_predict:
+            tokens, done_reason = tokens[:num_predict], "length"
+
+        system = body.get("system") or ""
+        prompt_tokens = max(1, (len(system) + len(prompt)) // CHARS_PER_TOKEN)
+        with server.lock:
+            if system and body.get("keep_alive") != 0 and system in server.prefixes:
+                prompt_tokens = max(1, prompt_tokens - len(system) // CHARS_PER_TOKEN)
+        prompt_eval_s = prompt_tokens / server.prompt_rate
+        eval_s = len(tokens) / server.token_rate
+
+        with server.slots:
+            start = time.perf_counter()
+            time.sleep(server.latency + prompt_eval_s)
+            if system:
+                with server.lock:
+                    server.prefixes.add(system)
+            final = {
+                "model": body.get("model", "fake"),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": True,
+                "done_reason": done_reason,
+                "context": [],
+                "load_duration": int(server.latency * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_eval_s * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int(eval_s * 1e9),
+            }
+
+            if not body.get("stream", True):
+                time.sleep(eval_s)
+                final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+                self._send_json(200, dict(final, response="".join(tokens)))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                try:
+                    self._write_chunk({"model": final["model"], "response": token, "done": False})
+                except (BrokenPipeError, ConnectionResetError):
+                    with server.lock:
+                        server.cancelled += 1
+                    self.close_connection = True
+                    return
+                time.sleep(1 / server.token_rate)
+            final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+            self._write_chunk(dict(final, response=""))
+            self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(host="127.0.0.1", port=0, **config):
+    """Start a fake server on a background thread; port 0 picks a free port."""
+    server = FakeOllamaServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+                        help="Fixed seconds before the first token")
+    parser.add_argument("--prompt-rate", type=float, default=DEFAULT_PROMPT_RATE,
+                        help="Prompt tokens evaluated per second")
+    parser.add_argument("--token-rate", type=float, default=DEFAULT_TOKEN_RATE,
+                        help="Generated tokens per second")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_ERROR_RATE,
+                        help="Share of requests answered with HTTP 503")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL,
+                        help="Requests processed at once, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--recipes", type=Path, default=RECIPES_PATH,
+                        help="recipes.json to take canned outputs from")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer((args.host, args.port), args.latency, args.prompt_rate, args.token_rate,
+                              args.error_rate, args.parallel, load_canned_outputs(args.recipes))
+    print(f"Fake Ollama serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
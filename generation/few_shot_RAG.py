@@ -1,21 +1,31 @@
-import json
 import os
-import ollama
+import sys
+import asyncio
+import contextvars
+from pathlib import Path
 from datetime import datetime
 from backports.zoneinfo import ZoneInfo
-from retrieval.recipe_retriever import RecipeRetriever
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.client import get_retriever
+from generation.engine import (AsyncGenerationEngine, sample_metrics, shared_prefix_kwargs,
+                               structured_output_kwargs, GenerationError, DEFAULT_CONCURRENCY)
+from generation.pipeline import Pipeline, Stage
+from generation.response_cache import ResponseCache
+from generation.dishes import DISHES
+from generation.result_sink import JSONLResultWriter, jsonl_to_json
+from evaluation.profiler import span
 
 MODEL_NAME = "llama3.2:3b"
 TEMPERATURE = 0.5
 MAX_TOKENS = 800
-
-DISHES = [
-    "Vegetarian Lasagne",
-    "Pepperoni Pizza",
-    "Chicken Burger"
-]
+SEED = 42
 
 OUT_PATH = "results/few_shot_RAG.json"
+RESULTS_PATH = "results/few_shot_RAG.jsonl"  # streamed per sample; OUT_PATH is built from it
+RETRIEVAL_BATCH_SIZE = 32  # dishes per retrieve_many call in the pipeline
 
 PROMPT_TEMPLATE = (
     "Give me a clear, step-by-step recipe for {dish}.\n"
@@ -28,57 +38,171 @@ PROMPT_TEMPLATE = (
     "Do not include any text outside this JSON object."
 )
 
-def generate_recipe(dish, retriever):
-    retrieved_text, retrieved_id, retrieved_name = retriever.retrieve(dish, k=1)[0]
-
-    prompt = PROMPT_TEMPLATE.format(
-        dish=dish,
-        retrieved_recipe=retrieved_text
-    )
-
-    response = ollama.generate(
-        model=MODEL_NAME,
-        prompt=prompt,
-        options={
-            "temperature": TEMPERATURE,
-            "num_predict": MAX_TOKENS
-        }
-    )
+# Shared-prefix layout: the fixed instructions are sent as the system prompt, so every
+# request starts with the same tokens, and only the dish and its reference recipe vary
+SYSTEM_PROMPT = (
+    "You write clear, step-by-step recipes.\n"
+    "Each request includes a similar recipe for reference.\n"
+    "Use it only as inspiration. Do not copy it verbatim.\n"
+    "Return your output strictly in the following format:\n"
+    "{\"ingredients\": [\"ingredient 1\", \"ingredient 2\", ...], \"steps\": [\"step 1\", \"step 2\", ...]}\n"
+    "Do not include any text outside this JSON object."
+)
+USER_TEMPLATE = (
+    "Give me a clear, step-by-step recipe for {dish}.\n\n"
+    "REFERENCE RECIPE:\n"
+    "{retrieved_recipe}"
+)
 
-    return prompt, retrieved_id, retrieved_name, response["response"]
+OPTIONS = {
+    "temperature": TEMPERATURE,
+    "num_predict": MAX_TOKENS
+}
+
+def build_prompt(job, shared_prefix=False):
+    """Result stub with the formatted prompt for a (dish, retrieved) job."""
+    dish, retrieved = job
+    retrieved_text, retrieved_id, retrieved_name = retrieved
+
+    with span("prompt.format"):
+        prompt = (USER_TEMPLATE if shared_prefix else PROMPT_TEMPLATE).format(
+            dish=dish,
+            retrieved_recipe=retrieved_text
+        )
+
+    return {
+        "dish_name": dish,
+        "prompt": prompt,
+        "retrieved_recipe_id": retrieved_id,
+        "retrieved_dish_name": retrieved_name,
+    }
 
-def main():
+def request_kwargs(shared_prefix=False, structured=False):
+    """Extra generate() kwargs for the prompt layout and output mode."""
+    kwargs = {}
+    if shared_prefix:
+        kwargs.update(shared_prefix_kwargs(SYSTEM_PROMPT))
+    if structured:
+        kwargs.update(structured_output_kwargs())
+    return kwargs
+
+async def complete_recipe(result, engine, shared_prefix=False, structured=False, **generate_kwargs):
+    dish = result["dish_name"]
+    print(f"Generating few-shot RAG recipe for {dish}")
+    generate_kwargs = dict(request_kwargs(shared_prefix, structured), **generate_kwargs)
+
+    try:
+        response = await engine.generate(result["prompt"], **generate_kwargs)
+        result["output"] = response["response"]
+        result["metrics"] = sample_metrics(response, MAX_TOKENS)
+    except GenerationError as e:
+        print(f"  failed for {dish}: {e}")
+        result["output"] = ""
+        result["error"] = str(e)
+
+    return result
+
+async def generate_recipe(job, engine, shared_prefix=False, structured=False, **generate_kwargs):
+    return await complete_recipe(build_prompt(job, shared_prefix), engine, shared_prefix, structured,
+                                 **generate_kwargs)
+
+async def run_pipeline(dishes, retriever, sink, concurrency=DEFAULT_CONCURRENCY, cache=None, shared_prefix=False,
+                       structured=False):
+    """
+    Retrieval -> prompt -> generation as a bounded-queue pipeline: batches
+    for upcoming dishes are retrieved while earlier ones generate. Returns
+    the per-stage stats from Pipeline.stats().
+    """
+    async with AsyncGenerationEngine(MODEL_NAME, OPTIONS, concurrency=concurrency,
+                                     cache=cache, seed=SEED) as engine:
+        async def retrieve(batch):
+            # Off the event loop so embedding the batch overlaps in-flight generations; the copied
+            # context keeps the retriever's spans nested here (asyncio.to_thread needs Python 3.9)
+            with span("retrieval", queries=len(batch)):
+                context = contextvars.copy_context()
+                retrieved = await asyncio.get_running_loop().run_in_executor(
+                    None, context.run, retriever.retrieve_many, batch, 1)
+            return [(dish, hits[0]) for dish, hits in zip(batch, retrieved)]
+
+        async def prompt(job):
+            return [build_prompt(job, shared_prefix)]
+
+        async def generate(result):
+            sink.write(await complete_recipe(result, engine, shared_prefix, structured))
+
+        pipeline = Pipeline([
+            Stage("retrieval", retrieve),
+            Stage("prompt", prompt),
+            Stage("generation", generate, workers=concurrency),
+        ], queue_size=2 * concurrency)
+        batches = (dishes[i:i + RETRIEVAL_BATCH_SIZE] for i in range(0, len(dishes), RETRIEVAL_BATCH_SIZE))
+        await pipeline.run(batches)
+        return pipeline.stats()
+
+def main(retriever=None, concurrency=DEFAULT_CONCURRENCY, use_cache=True, resume=False, dishes=None,
+         shared_prefix=False, structured=False):
     os.makedirs("results", exist_ok=True)
+    dishes = DISHES if dishes is None else list(dishes)
 
-    retriever = RecipeRetriever()
-
-    outputs = {
+    header = {
         "version": "pilot",
         "condition": "few_shot_RAG",
         "model": MODEL_NAME,
         "temperature": TEMPERATURE,
         "max_tokens": MAX_TOKENS,
+        "seed": SEED,
+        "prompt_layout": "shared_prefix" if shared_prefix else "inline",
+        "structured_output": structured,
         "timestamp": datetime.now(ZoneInfo("Europe/Berlin")).isoformat(),
-        "results": []
     }
 
-    for dish in DISHES:
-        print(f"Generating few-shot RAG recipe for {dish}")
+    if shared_prefix:
+        header["system_prompt"] = SYSTEM_PROMPT
+
+    cache = ResponseCache() if use_cache else None
+
+    with JSONLResultWriter(RESULTS_PATH, header, resume=resume) as sink:
+        todo = [dish for dish in dishes if dish not in sink.completed]
+
+        if todo and retriever is None:
+            with span("retriever.construct"):
+                retriever = get_retriever()
 
-        prompt, retrieved_id, retrieved_name, output = generate_recipe(dish, retriever)
+        pipeline_stats = None
+        if todo:
+            pipeline_stats = asyncio.run(run_pipeline(todo, retriever, sink, concurrency, cache,
+                                                      shared_prefix, structured))
+            sink.write_summary(pipeline=pipeline_stats)
+            stages = ", ".join(f"{name} {stage['utilisation']:.0%} (queue max {stage['queue_depth_max']})"
+                               for name, stage in pipeline_stats["stages"].items())
+            print(f"Pipeline utilisation: {stages}; bottleneck: {pipeline_stats['bottleneck']}")
 
-        outputs["results"].append({
-            "dish_name": dish,
-            "prompt": prompt,
-            "retrieved_recipe_id": retrieved_id,
-            "retrieved_dish_name": retrieved_name,
-            "output": output
-        })
+        if cache is not None:
+            stats = cache.stats()
+            cache.close()
+            sink.write_summary(response_cache=stats)
+            print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses")
 
-    with open(OUT_PATH, "w") as f:
-        json.dump(outputs, f, indent=2)
+    outputs = jsonl_to_json(RESULTS_PATH, OUT_PATH, order=dishes)
 
     print(f"\nSaved few-shot RAG results to {OUT_PATH}")
+    return outputs
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate few-shot RAG recipes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of in-flight Ollama requests")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the response cache and always call the model")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Skip dishes that already have a result in {RESULTS_PATH}")
+    parser.add_argument("--shared-prefix", action="store_true",
+                        help="Send the fixed instructions as a system prompt so Ollama reuses their KV cache")
+    parser.add_argument("--structured", action="store_true",
+                        help="Constrain output to JSON and stop as soon as the top-level object closes")
+    args = parser.parse_args()
+
+    main(concurrency=args.concurrency, use_cache=not args.no_cache, resume=args.resume,
+         shared_prefix=args.shared_prefix, structured=args.structured)
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Incremental scanner for the first top-level JSON object in streamed text.
+
+`feed` takes generated text piece by piece and tracks brace depth outside
+of string literals, so the end of the object is known the moment its
+closing brace arrives and the rest of the generation can be cancelled.
+Anything before the opening brace (e.g. "Here is the recipe:") is skipped.
+"""
+
+import json
+
+class JSONObjectScanner:
+    def __init__(self):
+        self.buffer = []
+        self.length = 0
+        self.start = None  # offset of the opening brace in the fed text
+        self.end = None  # offset just past the closing brace
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def closed(self):
+        return self.end is not None
+
+    def feed(self, text):
+        """Consume the next piece of text; returns True once the top-level object has closed."""
+        if self.closed:
+            return True
+        offset = self.length
+        self.buffer.append(text)
+        self.length += len(text)
+        for i, char in enumerate(text):
+            if self.start is None:
+                if char == "{":
+                    self.start, self._depth = offset + i, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = offset + i + 1
+                    return True
+        return False
+
+    def text(self):
+        """The object's text once closed, else everything fed so far."""
+        text = "".join(self.buffer)
+        return text[self.start:self.end] if self.closed else text
+
+    def parse(self):
+        """The parsed object, or None if it has not closed or is not valid JSON."""
+        if not self.closed:
+            return None
+        try:
+            return json.loads(self.text())
+        except ValueError:
+            return None
@@ -0,0 +1,119 @@
+"""
+Staged producer/consumer pipeline on asyncio with bounded queues.
+
+Each Stage runs `workers` coroutines that take items from the stage's input
+queue, await `fn(item)` and put every item of the returned list on the next
+stage's queue. Queues hold at most `queue_size` items, so a slow downstream
+stage blocks its producers (backpressure) and memory stays flat however
+many items the source yields. The source iterable is consumed lazily.
+
+Per stage the pipeline records items, busy time, time starved (waiting for
+input) and time blocked (waiting for room downstream); a sampler records
+queue depths. `stats()` reports utilisation (busy time / worker time) and
+names the busiest stage as the bottleneck.
+"""
+
+import time
+import asyncio
+
+DEFAULT_QUEUE_SIZE = 16
+SAMPLE_INTERVAL = 0.05  # seconds between queue depth samples
+
+_DONE = object()
+
+class Stage:
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.items = 0
+        self.busy_s = 0.0
+        self.starved_s = 0.0
+        self.blocked_s = 0.0
+
+class Pipeline:
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.queues = None
+        self.depths = [[] for _ in stages]
+        self.wall_s = None
+
+    async def _feed(self, source):
+        queue = self.queues[0]
+        for item in source:
+            await queue.put(item)
+        for _ in range(self.stages[0].workers):
+            await queue.put(_DONE)
+
+    async def _worker(self, index, finished):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            start = time.perf_counter()
+            item = await inbox.get()
+            stage.starved_s += time.perf_counter() - start
+            if item is _DONE:
+                break
+
+            start = time.perf_counter()
+            outputs = await stage.fn(item)
+            stage.busy_s += time.perf_counter() - start
+            stage.items += 1
+
+            if outbox is not None:
+                start = time.perf_counter()
+                for output in outputs or ():
+                    await outbox.put(output)
+                stage.blocked_s += time.perf_counter() - start
+
+        # The last worker of a stage to finish passes end-of-stream downstream
+        finished[index] += 1
+        if outbox is not None and finished[index] == stage.workers:
+            for _ in range(self.stages[index + 1].workers):
+                await outbox.put(_DONE)
+
+    async def _sample(self):
+        while True:
+            for depths, queue in zip(self.depths, self.queues):
+                depths.append(queue.qsize())
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    async def run(self, source):
+        """Push every source item through all stages; returns when the last stage drains."""
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        finished = [0] * len(self.stages)
+        sampler = asyncio.create_task(self._sample())
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(
+                self._feed(source),
+                *(self._worker(i, finished) for i, stage in enumerate(self.stages) for _ in range(stage.workers)),
+            )
+        finally:
+            self.wall_s = time.perf_counter() - start
+            sampler.cancel()
+
+    def stats(self):
+        """Per-stage items, busy/starved/blocked seconds, utilisation and input queue depth."""
+        stages = {}
+        for stage, depths in zip(self.stages, self.depths):
+            worker_s = self.wall_s * stage.workers if self.wall_s else 0.0
+            stages[stage.name] = {
+                "workers": stage.workers,
+                "items": stage.items,
+                "busy_s": round(stage.busy_s, 4),
+                "starved_s": round(stage.starved_s, 4),
+                "blocked_s": round(stage.blocked_s, 4),
+                "utilisation": round(stage.busy_s / worker_s, 4) if worker_s else None,
+                "queue_depth_mean": round(sum(depths) / len(depths), 2) if depths else 0,
+                "queue_depth_max": max(depths, default=0),
+            }
+        busiest = max(stages, key=lambda name: stages[name]["utilisation"] or 0) if stages else None
+        return {
+            "wall_s": round(self.wall_s or 0.0, 4),
+            "queue_size": self.queue_size,
+            "bottleneck": busiest,
+            "stages": stages,
+        }
@@ -0,0 +1,101 @@
+"""
+Persistent on-disk cache of LLM responses.
+
+Entries are keyed by the model digest (so a re-pulled model invalidates
+them), the full prompt, the options dict, the seed and any extra request
+arguments. The cache lives in a single SQLite file and is trimmed to
+`max_bytes` by evicting the least recently used entries. Hit/miss counts
+are kept per run so they can be recorded in the experiment metadata.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+RESPONSE_CACHE_PATH = Path("results/response_cache.sqlite")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+def cache_key(model_digest, prompt, options, seed=None, **request):
+    """Stable hash of everything that determines a generation."""
+    payload = json.dumps({
+        "model": model_digest,
+        "prompt": prompt,
+        "options": options,
+        "seed": seed,
+        "request": request,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Cached response dict for `key`, or None."""
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, response):
+        data = json.dumps(response, default=str)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+        self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        entries, size = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def close(self):
+        self.conn.close()
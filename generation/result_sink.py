@@ -0,0 +1,240 @@
+"""
+Append-only JSONL results file for generation runs.
+
+The first line is a header record holding the run config; every completed
+sample is appended as one JSON line as soon as it finishes, flushed
+immediately and fsynced every FSYNC_EVERY records or FSYNC_INTERVAL
+seconds. A crash therefore loses at most the sample in flight, and
+`resume=True` picks the file up again, skipping dishes that already have
+a successful result. `jsonl_to_json` turns the file into the aggregate
+JSON shape that MetricsCalculator reads; `iter_results` streams the result
+records of either format without loading the whole file.
+
+Convert a results file by hand with:
+    python -m generation.result_sink results/zero_shot.jsonl
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+from evaluation.profiler import span, profiled
+
+FSYNC_EVERY = 32
+FSYNC_INTERVAL = 2.0  # seconds
+READ_CHUNK = 1 << 20  # characters read at a time when streaming an aggregate JSON file
+
+# Header fields that may differ between the original run and its resumption
+RESUMABLE_FIELDS = ("timestamp",)
+
+def read_records(path):
+    """
+    (header, results, summary, end offset of the last complete line).
+    A torn final line left by a crash is ignored.
+    """
+    header, results, summary = None, [], {}
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if "header" in record:
+                header = record["header"]
+            elif "summary" in record:
+                summary.update(record["summary"])
+            else:
+                results.append(record)
+    return header, results, summary, offset
+
+class _JSONReader:
+    """Decodes consecutive JSON values from a file, reading it in READ_CHUNK pieces."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(READ_CHUNK)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it; raises at end of file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError(f"Unexpected end of {self.f.name}")
+
+    def skip(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in {self.f.name}, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        while True:
+            self.peek()
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_results(path, header=None):
+    """
+    Yield the result records of a .jsonl results file or an aggregate .json
+    file one at a time. Header and summary fields are added to `header` (a
+    dict) as they are read; in files written by this module the header comes
+    before the first result. JSONL records are yielded as written, so a
+    retried dish can appear more than once.
+    """
+    header = {} if header is None else header
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final line
+                record = json.loads(line)
+                if "header" in record:
+                    header.update(record["header"])
+                elif "summary" in record:
+                    header.update(record["summary"])
+                else:
+                    yield record
+        return
+
+    with open(path, "r") as f:
+        reader = _JSONReader(f)
+        reader.skip("{")
+        while reader.peek() != "}":
+            if reader.peek() == ",":
+                reader.skip(",")
+            key = reader.value()
+            reader.skip(":")
+            if key != "results":
+                header[key] = reader.value()
+                continue
+            reader.skip("[")
+            while reader.peek() != "]":
+                if reader.peek() == ",":
+                    reader.skip(",")
+                yield reader.value()
+            reader.skip("]")
+
+class JSONLResultWriter:
+    def __init__(self, path, header, resume=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.completed = set()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        if resume and self.path.exists():
+            previous, results, _, offset = read_records(self.path)
+            self._check_header(previous, header)
+            self.completed = {r["dish_name"] for r in results if not r.get("error")}
+            self.f = open(self.path, "r+b")
+            # Drop a torn final line so the next record starts on a fresh line
+            self.f.truncate(offset)
+            self.f.seek(offset)
+            print(f"Resuming {self.path}: {len(self.completed)} dishes already done")
+        else:
+            self.f = open(self.path, "wb")
+            self._append({"header": header})
+            self.sync()
+
+    def _check_header(self, previous, header):
+        ignore = lambda h: {k: v for k, v in (h or {}).items() if k not in RESUMABLE_FIELDS}
+        if ignore(previous) != ignore(header):
+            raise ValueError(
+                f"{self.path} was written with a different run config ({previous}); "
+                f"delete it or rerun without --resume"
+            )
+
+    def _append(self, record):
+        self.f.write(json.dumps(record, default=str).encode("utf-8") + b"\n")
+        self.f.flush()
+
+    def write(self, result):
+        """Append one completed sample."""
+        with span("results.write"):
+            self._append(result)
+        self._unsynced += 1
+        if (self._unsynced >= FSYNC_EVERY
+                or time.monotonic() - self._last_sync >= FSYNC_INTERVAL):
+            self.sync()
+
+    def write_summary(self, **fields):
+        """Append run-level fields (e.g. cache stats); merged into the aggregate JSON."""
+        self._append({"summary": fields})
+
+    def sync(self):
+        os.fsync(self.f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+@profiled("results.serialize")
+def jsonl_to_json(jsonl_path, json_path=None, order=None):
+    """
+    Write the aggregate {**header, **summary, "results": [...]} JSON.
+
+    The latest record per dish wins (a resumed retry replaces the earlier
+    failure); with `order` (dish names) results follow that order,
+    otherwise the order they completed in.
+    """
+    jsonl_path = Path(jsonl_path)
+    json_path = Path(json_path) if json_path else jsonl_path.with_suffix(".json")
+    header, results, summary, _ = read_records(jsonl_path)
+
+    latest = {}
+    for result in results:
+        latest[result["dish_name"]] = result
+    results = list(latest.values())
+    if order is not None:
+        position = {dish: i for i, dish in enumerate(order)}
+        results.sort(key=lambda r: position.get(r["dish_name"], len(position)))
+
+    outputs = {**(header or {}), **summary, "results": results}
+    with open(json_path, "w") as f:
+        json.dump(outputs, f, indent=2)
+    return outputs
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a JSONL results file to the aggregate JSON format")
+    parser.add_argument("source", type=Path, help="JSONL results file")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="JSON path (defaults to the source path with a .json suffix)")
+    args = parser.parse_args()
+
+    outputs = jsonl_to_json(args.source, args.output)
+    print(f"Saved {len(outputs['results'])} results to {args.output or args.source.with_suffix('.json')}")
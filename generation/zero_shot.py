@@ -1,18 +1,23 @@
-import json
 import os
-import ollama
+import sys
+from pathlib import Path
 from datetime import datetime
 from backports.zoneinfo import ZoneInfo
 
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from generation.engine import (run_generation, sample_metrics, shared_prefix_kwargs, structured_output_kwargs,
+                               GenerationError, DEFAULT_CONCURRENCY)
+from generation.response_cache import ResponseCache
+from generation.dishes import DISHES
+from generation.result_sink import JSONLResultWriter, jsonl_to_json
+from evaluation.profiler import span
+
 MODEL_NAME = "llama3.2:3b"
 TEMPERATURE = 0.5
 MAX_TOKENS = 800
-
-DISHES = [
-    "Vegetarian Lasagne",
-    "Pepperoni Pizza",
-    "Chicken Burger"
-]
+SEED = 42
 
 PROMPT_TEMPLATE = (
     "Give me a clear, step-by-step recipe for {dish}.\n"
@@ -22,50 +27,113 @@ PROMPT_TEMPLATE = (
     "Do not include any text outside this JSON object."
 )
 
+# Shared-prefix layout: the fixed instructions are sent as the system prompt, so every
+# request starts with the same tokens, and only the dish name varies
+SYSTEM_PROMPT = (
+    "You write clear, step-by-step recipes.\n"
+    "Include ingredients and cooking instructions.\n"
+    "Return your output strictly in the following format:\n"
+    "{\"ingredients\": [\"ingredient 1\", \"ingredient 2\", ...], \"steps\": [\"step 1\", \"step 2\", ...]}\n"
+    "Do not include any text outside this JSON object."
+)
+USER_TEMPLATE = "Give me a clear, step-by-step recipe for {dish}."
+
 OUT_PATH = "results/zero_shot.json"
+RESULTS_PATH = "results/zero_shot.jsonl"  # streamed per sample; OUT_PATH is built from it
 
-def generate_recipe(dish):
-    prompt = PROMPT_TEMPLATE.format(dish=dish)
+OPTIONS = {
+    "temperature": TEMPERATURE,
+    "num_predict": MAX_TOKENS
+}
 
-    response = ollama.generate(
-        model=MODEL_NAME,
-        prompt=prompt,
-        options={
-            "temperature": TEMPERATURE,
-            "num_predict": MAX_TOKENS
-        }
-    )
+def request_kwargs(shared_prefix=False, structured=False):
+    """Extra generate() kwargs for the prompt layout and output mode."""
+    kwargs = {}
+    if shared_prefix:
+        kwargs.update(shared_prefix_kwargs(SYSTEM_PROMPT))
+    if structured:
+        kwargs.update(structured_output_kwargs())
+    return kwargs
 
-    return prompt, response["response"]
+async def generate_recipe(dish, engine, shared_prefix=False, structured=False, **generate_kwargs):
+    with span("prompt.format"):
+        prompt = (USER_TEMPLATE if shared_prefix else PROMPT_TEMPLATE).format(dish=dish)
+    generate_kwargs = dict(request_kwargs(shared_prefix, structured), **generate_kwargs)
+    print(f"Generating zero shot recipe for {dish}")
 
-def main():
+    result = {
+        "dish_name": dish,
+        "prompt": prompt,
+    }
+
+    try:
+        response = await engine.generate(prompt, **generate_kwargs)
+        result["output"] = response["response"]
+        result["metrics"] = sample_metrics(response, MAX_TOKENS)
+    except GenerationError as e:
+        print(f"  failed for {dish}: {e}")
+        result["output"] = ""
+        result["error"] = str(e)
+
+    return result
+
+def main(concurrency=DEFAULT_CONCURRENCY, use_cache=True, resume=False, dishes=None, shared_prefix=False,
+         structured=False):
     os.makedirs("results", exist_ok=True)
+    dishes = DISHES if dishes is None else list(dishes)
 
-    outputs = {
+    header = {
         "version": "pilot",
         "condition": "zero_shot",
         "model": MODEL_NAME,
         "temperature": TEMPERATURE,
         "max_tokens": MAX_TOKENS,
+        "seed": SEED,
+        "prompt_layout": "shared_prefix" if shared_prefix else "inline",
+        "structured_output": structured,
         "timestamp": datetime.now(ZoneInfo("Europe/Berlin")).isoformat(),
-        "results": []
     }
 
-    for dish in DISHES:
-        print(f"Generating zero shot recipe for {dish}")
+    if shared_prefix:
+        header["system_prompt"] = SYSTEM_PROMPT
 
-        prompt, output = generate_recipe(dish)
+    cache = ResponseCache() if use_cache else None
 
-        outputs["results"].append({
-            "dish_name": dish,
-            "prompt": prompt,
-            "output": output
-        })
+    with JSONLResultWriter(RESULTS_PATH, header, resume=resume) as sink:
+        todo = [dish for dish in dishes if dish not in sink.completed]
 
-    with open(OUT_PATH, "w") as f:
-        json.dump(outputs, f, indent=2)
+        # Each result is appended to RESULTS_PATH as soon as its request finishes
+        async def generate_and_write(dish, engine):
+            sink.write(await generate_recipe(dish, engine, shared_prefix, structured))
+
+        run_generation(generate_and_write, todo, MODEL_NAME, OPTIONS,
+                       concurrency=concurrency, cache=cache, seed=SEED)
+        if cache is not None:
+            stats = cache.stats()
+            cache.close()
+            sink.write_summary(response_cache=stats)
+            print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses")
+
+    outputs = jsonl_to_json(RESULTS_PATH, OUT_PATH, order=dishes)
 
     print(f"\nSaved zero shot results to {OUT_PATH}")
+    return outputs
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate zero-shot recipes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of in-flight Ollama requests")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the response cache and always call the model")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Skip dishes that already have a result in {RESULTS_PATH}")
+    parser.add_argument("--shared-prefix", action="store_true",
+                        help="Send the fixed instructions as a system prompt so Ollama reuses their KV cache")
+    parser.add_argument("--structured", action="store_true",
+                        help="Constrain output to JSON and stop as soon as the top-level object closes")
+    args = parser.parse_args()
+
+    main(concurrency=args.concurrency, use_cache=not args.no_cache, resume=args.resume,
+         shared_prefix=args.shared_prefix, structured=args.structured)
\ No newline at end of file
@@ -0,0 +1,295 @@
+"""
+Offline retrieval benchmark on synthetic embedding corpora.
+
+Generates clustered, L2-normalised random corpora of the embedding model's
+dimension (1k up to 10M rows), written block by block into the same
+memory-mapped embedding store RecipeRetriever reads, so nothing is
+downloaded and no encoder runs. Corpora are kept under the bench directory
+and reused on later runs; `--store` benchmarks an existing embedding cache
+instead, with perturbed corpus rows as queries.
+
+For every corpus, index backend (and nprobe for IVF) it reports index build
+and load time, memory footprint, single-query and batched p50/p99 latency,
+QPS, and recall@k against exact search, and writes everything as JSON so
+two commits can be compared with `--baseline`.
+
+Usage:
+    python -m retrieval.benchmark --sizes 1000 10000 100000 --output results/bench_retrieval.json
+    python -m retrieval.benchmark --sizes 1000 10000 --baseline results/bench_retrieval.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import argparse
+import subprocess
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from datetime import datetime, timezone
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.index import ExactIndex, IVFIndex, DEFAULT_NPROBE, normalize
+from retrieval.embedding_store import EmbeddingStore, EmbeddingStoreWriter, STORE_DTYPES
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_DIM = 1024  # gte-large-en-v1.5
+DEFAULT_BATCH_SIZES = (1, 16, 64)
+DEFAULT_NUM_QUERIES = 200
+DEFAULT_K = 10
+BENCH_DIR = Path("results/bench")
+
+SYNTHETIC_CLUSTERS = 512
+SYNTHETIC_NOISE = 0.6  # norm of the offset of a vector from its cluster centre
+GENERATE_BLOCK_SIZE = 65_536
+
+# A result is reported as a regression when latency grows or recall drops by more than this
+REGRESSION_TOLERANCE = 0.10
+
+def _centres(dim, seed):
+    return normalize(np.random.default_rng(seed).normal(size=(SYNTHETIC_CLUSTERS, dim)))
+
+def synthetic_store(path, rows, dim=DEFAULT_DIM, dtype="float16", seed=0):
+    """Create (or reuse) a synthetic corpus of `rows` clustered unit vectors."""
+    fingerprint = f"synthetic-{rows}-{dim}-{dtype}-{seed}"
+    store = EmbeddingStore.open(path)
+    if store is not None and store.fingerprint == fingerprint:
+        return store
+
+    print(f"Generating synthetic corpus ({rows:,} x {dim}, {dtype})...")
+    centres = _centres(dim, seed)
+    rng = np.random.default_rng(seed + 1)
+    writer = EmbeddingStoreWriter(path, rows, dim, "synthetic", dtype=dtype)
+    for start in range(0, rows, GENERATE_BLOCK_SIZE):
+        n = min(GENERATE_BLOCK_SIZE, rows - start)
+        block = centres[rng.integers(SYNTHETIC_CLUSTERS, size=n)]
+        block = normalize(block + SYNTHETIC_NOISE / np.sqrt(dim) * rng.normal(size=(n, dim)))
+        keys = [f"{row:032x}" for row in range(start, start + n)]
+        writer.write(slice(start, start + n), block, keys)
+    return writer.close(fingerprint)
+
+def synthetic_queries(num_queries, dim=DEFAULT_DIM, seed=0):
+    """Queries drawn around the same cluster centres as the corpus."""
+    rng = np.random.default_rng(seed + 2)
+    centres = _centres(dim, seed)
+    queries = centres[rng.integers(SYNTHETIC_CLUSTERS, size=num_queries)]
+    return normalize(queries + SYNTHETIC_NOISE / np.sqrt(dim) * rng.normal(size=(num_queries, dim)))
+
+def store_queries(store, num_queries, seed=0):
+    """Perturbed corpus rows, for benchmarking a real embedding cache."""
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(store), size=min(num_queries, len(store)), replace=False))
+    vectors = store[rows]
+    return normalize(vectors + 0.05 * rng.normal(size=vectors.shape))
+
+def _percentiles_ms(seconds):
+    p50, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 99])
+    return round(float(p50), 3), round(float(p99), 3)
+
+def _recall(found, truth, k):
+    hits = sum(len(set(ids.tolist()) & expected) for ids, expected in zip(found, truth))
+    return round(hits / (k * len(truth)), 4)
+
+def _index_bytes(index):
+    """Memory held by the index structures themselves (the vectors stay memory-mapped)."""
+    if isinstance(index, IVFIndex):
+        return int(index.centroids.nbytes + index.list_offsets.nbytes + index.list_ids.nbytes)
+    return 0
+
+def bench_index(index, queries, k, batch_sizes, truth, **search_kwargs):
+    """Single-query and batched latency, QPS and recall@k of one index."""
+    latencies, found = [], []
+    start = time.perf_counter()
+    for query in queries:
+        t = time.perf_counter()
+        found.append(index.search_many(query[None, :], k, **search_kwargs)[1][0])
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+    p50, p99 = _percentiles_ms(latencies)
+    report = {
+        f"recall@{k}": _recall(found, truth, k),
+        "single": {"p50_ms": p50, "p99_ms": p99, "qps": round(len(queries) / total, 1)},
+        "batched": {},
+    }
+
+    for batch_size in batch_sizes:
+        if batch_size == 1:
+            continue
+        latencies = []
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batch_size):
+            t = time.perf_counter()
+            index.search_many(queries[offset:offset + batch_size], k, **search_kwargs)
+            latencies.append(time.perf_counter() - t)
+        total = time.perf_counter() - start
+        p50, p99 = _percentiles_ms(latencies)
+        report["batched"][str(batch_size)] = {
+            "p50_ms": p50, "p99_ms": p99, "qps": round(len(queries) / total, 1),
+        }
+    return report
+
+def bench_corpus(store_path, queries, k=DEFAULT_K, batch_sizes=DEFAULT_BATCH_SIZES,
+                 backends=("exact", "ivf"), nprobe_values=(DEFAULT_NPROBE,), label=None):
+    """Benchmark every backend on one embedding store; returns a list of result dicts."""
+    start = time.perf_counter()
+    store = EmbeddingStore(store_path)
+    store_load_s = time.perf_counter() - start
+    corpus = {
+        "corpus": label or str(store_path),
+        "rows": len(store),
+        "dim": store.dim,
+        "dtype": store.dtype,
+        "store_bytes": os.path.getsize(store_path),
+        "store_load_s": round(store_load_s, 6),
+    }
+
+    print(f"Exact ground truth for {len(queries)} queries on {len(store):,} rows...")
+    truth = [set(ids.tolist()) for ids in ExactIndex(store).search_many(queries, k)[1]]
+
+    results = []
+    for backend in backends:
+        tracemalloc.start()
+        start = time.perf_counter()
+        if backend == "exact":
+            index = ExactIndex.build(store)
+        else:
+            index = IVFIndex.build(store, fingerprint=store.fingerprint)
+        build_s = time.perf_counter() - start
+        build_peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        load_s = store_load_s
+        if backend == "ivf":
+            index_path = Path(store_path).with_suffix(".ivf.npz")
+            index.save(index_path)
+            start = time.perf_counter()
+            index = IVFIndex.load(index_path, store, fingerprint=store.fingerprint)
+            load_s = store_load_s + time.perf_counter() - start
+
+        settings = nprobe_values if backend == "ivf" else (None,)
+        for nprobe in settings:
+            search_kwargs = {"nprobe": nprobe} if nprobe else {}
+            print(f"  {backend}{f' nprobe={nprobe}' if nprobe else ''}...")
+            results.append({
+                **corpus,
+                "backend": backend,
+                "nprobe": nprobe,
+                "build_s": round(build_s, 4),
+                "load_s": round(load_s, 6),
+                "index_bytes": _index_bytes(index),
+                "build_peak_bytes": build_peak_bytes,
+                **bench_index(index, queries, k, batch_sizes, truth, **search_kwargs),
+            })
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _result_key(result):
+    return (result["corpus"], result["rows"], result["backend"], result["nprobe"])
+
+def compare_reports(baseline, current, k=DEFAULT_K, tolerance=REGRESSION_TOLERANCE):
+    """Lines describing latency or recall regressions of `current` against `baseline`."""
+    previous = {_result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(_result_key(result))
+        if old is None:
+            continue
+        nprobe = f" nprobe={result['nprobe']}" if result["nprobe"] else ""
+        name = f"{result['backend']}{nprobe} rows={result['rows']:,}"
+        for mode, now, before in [("single", result["single"], old["single"])] + [
+            (f"batch {b}", stats, old["batched"][b])
+            for b, stats in result["batched"].items() if b in old["batched"]
+        ]:
+            if now["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{name} {mode}: p50 {before['p50_ms']}ms -> {now['p50_ms']}ms")
+        recall = f"recall@{k}"
+        if recall in old and result[recall] < old[recall] - tolerance * old[recall]:
+            regressions.append(f"{name}: {recall} {old[recall]} -> {result[recall]}")
+    return regressions
+
+def run_benchmark(sizes=DEFAULT_SIZES, dim=DEFAULT_DIM, dtype="float16", num_queries=DEFAULT_NUM_QUERIES,
+                  k=DEFAULT_K, batch_sizes=DEFAULT_BATCH_SIZES, backends=("exact", "ivf"),
+                  nprobe_values=(DEFAULT_NPROBE,), store=None, bench_dir=BENCH_DIR, seed=0):
+    """Run the suite on synthetic corpora of the given sizes, or on an existing store."""
+    results = []
+    if store is not None:
+        queries = store_queries(EmbeddingStore(store), num_queries, seed)
+        results += bench_corpus(store, queries, k, batch_sizes, backends, nprobe_values)
+    else:
+        queries = synthetic_queries(num_queries, dim, seed)
+        for rows in sizes:
+            path = Path(bench_dir) / f"synthetic_{rows}_{dim}_{dtype}.emb"
+            synthetic_store(path, rows, dim, dtype, seed)
+            results += bench_corpus(path, queries, k, batch_sizes, backends, nprobe_values,
+                                    label="synthetic")
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "num_queries": len(queries),
+            "k": k,
+            "seed": seed,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval index backends offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Synthetic corpus sizes in rows")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default="float16")
+    parser.add_argument("--store", type=Path, default=None,
+                        help="Benchmark an existing embedding store instead of synthetic corpora")
+    parser.add_argument("--backends", nargs="+", choices=["exact", "ivf"], default=["exact", "ivf"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[DEFAULT_NPROBE])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--queries", type=int, default=DEFAULT_NUM_QUERIES)
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--bench-dir", type=Path, default=BENCH_DIR,
+                        help="Where synthetic corpora are generated and reused")
+    parser.add_argument("--output", type=Path, default=Path("results/bench_retrieval.json"))
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Earlier benchmark JSON to report regressions against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Relative latency / recall change reported as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.dim, args.dtype, args.queries, args.k, args.batch_sizes,
+                           args.backends, args.nprobe, args.store, args.bench_dir)
+
+    print(f"\n{'backend':<8} {'nprobe':>6} {'rows':>11} {'build s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'qps':>9} {'recall@' + str(args.k):>9}")
+    for r in report["results"]:
+        print(f"{r['backend']:<8} {str(r['nprobe'] or '-'):>6} {r['rows']:>11,} {r['build_s']:>9.3f} "
+              f"{r['single']['p50_ms']:>8.3f} {r['single']['p99_ms']:>8.3f} {r['single']['qps']:>9.1f} "
+              f"{r[f'recall@{args.k}']:>9.4f}")
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            regressions = compare_reports(json.load(f), report, args.k, args.tolerance)
+        print(f"\n{len(regressions)} regressions against {args.baseline}")
+        for line in regressions:
+            print(f"  {line}")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark results saved to {args.output}")
@@ -0,0 +1,141 @@
+"""
+Lexical BM25 index over RecipeRetriever documents.
+
+Postings are stored CSR-style in flat numpy arrays: the postings of term t
+are `doc_ids[term_offsets[t]:term_offsets[t + 1]]` with matching term
+frequencies in `term_freqs`, sorted by document id. Only the vocabulary
+itself is a dict (term -> id). The index is saved as a single .npz next to
+the embedding store and keyed on the same content fingerprint.
+"""
+
+import re
+import numpy as np
+from pathlib import Path
+from collections import Counter
+from retrieval.index import top_k
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+BUILD_CHUNK_SIZE = 50_000
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    def __init__(self, terms, term_offsets, doc_ids, term_freqs, doc_lengths,
+                 k1=DEFAULT_K1, b=DEFAULT_B, fingerprint=None):
+        self.terms = terms
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint
+
+        self.num_docs = len(doc_lengths)
+        self.avg_doc_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        doc_freqs = np.diff(term_offsets)
+        self.idf = np.log1p((self.num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(self.avg_doc_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, documents, k1=DEFAULT_K1, b=DEFAULT_B, fingerprint=None):
+        """Tokenise every document and lay the postings out term-major."""
+        vocab = {}
+        length_chunks, term_chunks, doc_chunks, freq_chunks = [], [], [], []
+        chunk_lengths, chunk_terms, chunk_docs, chunk_freqs = [], [], [], []
+
+        def flush():
+            length_chunks.append(np.array(chunk_lengths, dtype=np.int32))
+            term_chunks.append(np.array(chunk_terms, dtype=np.int32))
+            doc_chunks.append(np.array(chunk_docs, dtype=np.int32))
+            freq_chunks.append(np.minimum(chunk_freqs, np.iinfo(np.uint16).max).astype(np.uint16))
+            for chunk in (chunk_lengths, chunk_terms, chunk_docs, chunk_freqs):
+                chunk.clear()
+
+        # Documents are only iterated once, so lazily built ones are never all in memory
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            chunk_lengths.append(len(tokens))
+            for term, freq in Counter(tokens).items():
+                chunk_terms.append(vocab.setdefault(term, len(vocab)))
+                chunk_docs.append(doc_id)
+                chunk_freqs.append(freq)
+            if len(chunk_lengths) == BUILD_CHUNK_SIZE:
+                flush()
+        flush()
+
+        doc_lengths = np.concatenate(length_chunks)
+        term_ids = np.concatenate(term_chunks)
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=term_offsets[1:])
+
+        doc_ids = np.concatenate(doc_chunks)[order]
+        term_freqs = np.concatenate(freq_chunks)[order]
+        terms = np.array(sorted(vocab, key=vocab.get), dtype=str)
+        return cls(terms, term_offsets, doc_ids, term_freqs, doc_lengths, k1, b, fingerprint)
+
+    def scores(self, query, mask=None):
+        """
+        Dense BM25 score vector over all documents for one query string.
+        Postings of documents outside the optional boolean `mask` are skipped.
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.doc_ids[lo:hi]
+            tf = self.term_freqs[lo:hi].astype(np.float32)
+            if mask is not None:
+                keep = mask[docs]
+                docs, tf = docs[keep], tf[keep]
+            # Postings hold each document at most once per term, so plain fancy-add is safe
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+        return scores
+
+    def search(self, query, k, mask=None):
+        """Return (scores, ids) of the k best matching documents; only documents with a match."""
+        scores = self.scores(query, mask)
+        matched = np.flatnonzero(scores)
+        best = top_k(scores[matched], k)
+        return scores[matched][best], matched[best]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=self.terms,
+                term_offsets=self.term_offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                params=np.array([self.k1, self.b]),
+                fingerprint=np.array(self.fingerprint or ""),
+            )
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Load a saved index, or return None if it belongs to other documents."""
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            k1, b = data["params"].tolist()
+            return cls(data["terms"], data["term_offsets"], data["doc_ids"], data["term_freqs"],
+                       data["doc_lengths"], k1, b, fingerprint)
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60):
+    """Fuse several ranked id lists; each id scores sum(1 / (rrf_k + rank))."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return np.array([score for _, score in best], dtype=np.float32), np.array([i for i, _ in best], dtype=np.int64)
@@ -0,0 +1,205 @@
+"""
+Chunked, resumable, multi-process corpus embedding job.
+
+Streams documents from recipes.json, a SQLite recipe store or a
+RecipeNLG-style CSV (full_dataset.csv), fans fixed-size chunks out to a CPU process pool with
+one encoder per worker, and writes each finished chunk as a shard. A shard
+file only appears once its chunk is fully encoded, so an interrupted build
+resumes by skipping the shards already on disk. When every chunk is done the
+shards are merged into the memory-mapped embedding store that
+RecipeRetriever opens, with the same content keys and fingerprint.
+
+Usage:
+    python -m retrieval.build_embeddings --source data/full_dataset.csv \\
+        --output data/full_embeddings.emb --workers 4
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from pathlib import Path
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.index import normalize
+from retrieval.embedding_store import EmbeddingStoreWriter, KEY_BYTES, STORE_DTYPES
+from retrieval.documents import normalize_recipe, build_document, document_key
+from retrieval.recipe_store import RecipeStore
+from retrieval.recipe_retriever import DATA_PATH, EMBEDDINGS_CACHE_PATH, EMBEDDING_MODEL, cache_fingerprint
+
+DEFAULT_CHUNK_SIZE = 2048
+DEFAULT_ENCODE_BATCH_SIZE = 32
+
+def iter_recipes(source):
+    """
+    Yield recipe dicts from recipes.json or, streamed row by row, from a
+    SQLite recipe store or a RecipeNLG CSV.
+    """
+    source = Path(source)
+    if source.suffix == ".sqlite":
+        yield from RecipeStore(source)
+    elif source.suffix == ".csv":
+        csv.field_size_limit(sys.maxsize)
+        with open(source, newline="") as f:
+            for row in csv.DictReader(f):
+                yield normalize_recipe({
+                    "dish_id": row.get("Unnamed: 0") or row.get("", ""),
+                    "dish_name": row["title"],
+                    "ingredients": row["ingredients"],
+                    "steps": row["directions"],
+                })
+    else:
+        with open(source, "r") as f:
+            for recipe in json.load(f)["recipes"]:
+                yield normalize_recipe(recipe)
+
+def iter_chunks(source, chunk_size):
+    """Yield lists of document texts of at most chunk_size."""
+    documents = (build_document(r) for r in iter_recipes(source))
+    while True:
+        chunk = list(islice(documents, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+_encoder = None
+
+def _init_worker(model_name, threads):
+    global _encoder
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _encoder = SentenceTransformer(model_name, trust_remote_code=True, device="cpu")
+
+def _encode_chunk(shard_path, documents, batch_size):
+    """Encode one chunk and write it as a shard; runs in a worker process."""
+    vectors = normalize(_encoder.encode(documents, batch_size=batch_size, convert_to_numpy=True))
+    keys = np.array([bytes.fromhex(document_key(d)) for d in documents], dtype=f"S{KEY_BYTES}")
+
+    tmp_path = shard_path.with_name(shard_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, vectors=vectors.astype(np.float16), keys=keys)
+    os.replace(tmp_path, shard_path)
+    return len(documents)
+
+def _check_manifest(shard_dir, config):
+    """Refuse to resume shards written with a different model, source (path, size, mtime) or chunk size."""
+    manifest = shard_dir / "manifest.json"
+    if manifest.exists():
+        previous = json.loads(manifest.read_text())
+        if previous != config:
+            raise ValueError(
+                f"{shard_dir} holds shards for a different build ({previous}); "
+                f"delete it or pass the same settings to resume"
+            )
+    else:
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        manifest.write_text(json.dumps(config, indent=2))
+
+def merge_shards(shard_dir, output, dtype, model_name=EMBEDDING_MODEL):
+    """Merge completed shards, in chunk order, into an embedding store."""
+    shard_paths = sorted(shard_dir.glob("shard_*.npz"))
+    if not shard_paths:
+        raise ValueError(f"No shards to merge in {shard_dir}: the source yielded no documents")
+    sizes = []
+    for path in shard_paths:
+        with np.load(path) as shard:
+            sizes.append(len(shard["keys"]))
+            dim = shard["vectors"].shape[1]
+
+    writer = EmbeddingStoreWriter(output, sum(sizes), dim, model_name, dtype=dtype)
+    keys = []
+    start = 0
+    for path, size in zip(shard_paths, sizes):
+        with np.load(path) as shard:
+            writer.write(slice(start, start + size), shard["vectors"].astype(np.float32))
+            keys.extend(key.ljust(KEY_BYTES, b"\0").hex() for key in shard["keys"])
+        start += size
+    writer.set_keys(keys)
+    return writer.close(cache_fingerprint(model_name, keys))
+
+def build_embeddings(source=DATA_PATH, output=EMBEDDINGS_CACHE_PATH, workers=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_ENCODE_BATCH_SIZE,
+                     dtype="float16", model_name=EMBEDDING_MODEL, keep_shards=False):
+    output = Path(output)
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    shard_dir = output.with_suffix(".shards")
+
+    # Size and mtime catch a source edited in place, whose rows no longer match the shards
+    source_stat = Path(source).stat()
+    _check_manifest(shard_dir, {
+        "model": model_name,
+        "source": str(Path(source).resolve()),
+        "source_size": source_stat.st_size,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "chunk_size": chunk_size,
+    })
+
+    print(f"Embedding {source} with {workers} workers x {threads} threads "
+          f"(chunks of {chunk_size})...")
+
+    encoded = skipped = 0
+    start_time = time.perf_counter()
+    in_flight = set()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, threads)) as pool:
+        def report(done):
+            nonlocal encoded
+            for future in done:
+                encoded += future.result()
+            elapsed = time.perf_counter() - start_time
+            print(f"  {encoded + skipped:,} docs done ({skipped:,} resumed), "
+                  f"{encoded / elapsed:.1f} docs/s")
+
+        for chunk_index, documents in enumerate(iter_chunks(source, chunk_size)):
+            shard_path = shard_dir / f"shard_{chunk_index:06d}.npz"
+            if shard_path.exists():
+                skipped += len(documents)
+                continue
+
+            # Keep at most two chunks per worker in flight so memory stays bounded
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                report(done)
+            in_flight.add(pool.submit(_encode_chunk, shard_path, documents, batch_size))
+
+        if in_flight:
+            report(wait(in_flight)[0])
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Encoded {encoded:,} docs in {elapsed:.1f}s "
+          f"({encoded / elapsed if elapsed else 0:.1f} docs/s); merging shards...")
+
+    store = merge_shards(shard_dir, output, dtype, model_name)
+    print(f"Embedding store with {len(store):,} rows written to {output}")
+
+    if not keep_shards:
+        shutil.rmtree(shard_dir)
+    return store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the recipe embedding store in resumable chunks")
+    parser.add_argument("--source", type=Path, default=DATA_PATH,
+                        help="recipes.json, a recipes.sqlite store or a RecipeNLG-style CSV")
+    parser.add_argument("--output", type=Path, default=EMBEDDINGS_CACHE_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_ENCODE_BATCH_SIZE)
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default="float16")
+    parser.add_argument("--keep-shards", action="store_true",
+                        help="Keep shard files after merging")
+    args = parser.parse_args()
+
+    build_embeddings(args.source, args.output, args.workers, args.chunk_size,
+                     args.batch_size, args.dtype, keep_shards=args.keep_shards)
@@ -0,0 +1,58 @@
+"""
+Thin client for the retrieval server; a drop-in for RecipeRetriever in the
+generation scripts.
+"""
+
+import os
+import json
+import urllib.error
+import urllib.request
+
+SERVER_URL_ENV = "RETRIEVAL_SERVER_URL"
+REQUEST_TIMEOUT = 60
+
+class RetrievalClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def _post(self, endpoint, payload):
+        request = urllib.request.Request(
+            self.url + endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())["results"]
+
+    def health(self):
+        with urllib.request.urlopen(self.url + "/health", timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())
+
+    def retrieve(self, query, k=1, mode="dense", filters=None):
+        """Same return shape as RecipeRetriever.retrieve."""
+        payload = {"query": query, "k": k, "mode": mode, "filters": filters}
+        return [tuple(r) for r in self._post("/retrieve", payload)]
+
+    def retrieve_many(self, queries, k=1, mode="dense", filters=None):
+        """Same return shape as RecipeRetriever.retrieve_many."""
+        payload = {"queries": list(queries), "k": k, "mode": mode, "filters": filters}
+        results = self._post("/retrieve_many", payload)
+        return [[tuple(r) for r in per_query] for per_query in results]
+
+def get_retriever(url=None):
+    """
+    Return a RetrievalClient if a retrieval server is configured (argument or
+    RETRIEVAL_SERVER_URL) and reachable, otherwise load a local RecipeRetriever.
+    """
+    url = url or os.environ.get(SERVER_URL_ENV)
+    if url:
+        client = RetrievalClient(url)
+        try:
+            client.health()
+            print(f"Using retrieval server at {url}")
+            return client
+        except (urllib.error.URLError, OSError) as e:
+            print(f"Retrieval server at {url} unavailable ({e}), loading retriever locally...")
+
+    from retrieval.recipe_retriever import RecipeRetriever
+    return RecipeRetriever()
@@ -0,0 +1,71 @@
+"""
+Recipe record normalisation and the searchable document text built from it.
+
+Shared by the retriever, the recipe store and the embedding build so that
+all of them derive identical documents and content keys. The title-keyword
+categories used to build the case base live here too, so evaluation code can
+categorise dishes without importing the pandas extraction script.
+"""
+
+import json
+import hashlib
+
+def normalize_recipe(recipe):
+    """
+    Parse JSON-encoded ingredients and steps in place. Records from the
+    gluten-free eval set (id/name) get the dish_id/dish_name fields as well.
+    """
+    if "dish_name" not in recipe and "name" in recipe:
+        recipe["dish_name"] = recipe["name"]
+        recipe["dish_id"] = str(recipe.get("id", ""))
+
+    if isinstance(recipe.get("ingredients"), str):
+        recipe["ingredients"] = json.loads(recipe["ingredients"])
+
+    if isinstance(recipe.get("steps"), str):
+        recipe["steps"] = json.loads(recipe["steps"])
+
+    return recipe
+
+def build_document(recipe):
+    """Searchable text of a recipe: name, ingredients and steps."""
+    return (
+        recipe.get("dish_name", "") + " "
+        + " ".join(recipe.get("ingredients", [])) + " "
+        + " ".join(recipe.get("steps", []))
+    )
+
+def document_key(text):
+    """Content hash identifying a document's embedding in the cache."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+# Categories for diverse sampling (keyword -> category name)
+# Recipes will be sampled proportionally from each category
+CATEGORIES = {
+    "chicken": ["chicken", "poultry"],
+    "beef": ["beef", "steak"],
+    "pork": ["pork", "bacon", "ham", "sausage"],
+    "seafood": ["fish", "salmon", "shrimp", "tuna", "seafood", "crab", "lobster"],
+    "vegetarian": ["vegetable", "veggie", "vegan", "tofu", "lentil", "bean"],
+    "pasta": ["pasta", "spaghetti", "lasagna", "lasagne", "noodle", "macaroni"],
+    "soup": ["soup", "stew", "chowder", "broth"],
+    "salad": ["salad"],
+    "dessert": ["cake", "cookie", "pie", "brownie", "chocolate", "ice cream", "dessert"],
+    "bread": ["bread", "muffin", "biscuit", "roll", "loaf"],
+    "breakfast": ["pancake", "waffle", "omelette", "omelet", "egg", "breakfast"],
+    "rice": ["rice", "risotto", "fried rice"],
+    "pizza": ["pizza"],
+    "sandwich": ["sandwich", "wrap", "burger"],
+    "other": []  # Catch-all for unmatched recipes
+}
+
+def categorize_recipe(title):
+    """Assign a recipe to a category based on title keywords."""
+    title_lower = title.lower()
+    for category, keywords in CATEGORIES.items():
+        if category == "other":
+            continue
+        for keyword in keywords:
+            if keyword in title_lower:
+                return category
+    return "other"
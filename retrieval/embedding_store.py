@@ -0,0 +1,176 @@
+"""
+Flat, memory-mapped embedding store.
+
+Layout of a store file:
+
+    [0, 4096)        magic + uint32 header length + JSON header
+    data_offset      rows x dim contiguous float16 or int8 values
+    scales_offset    rows float32 per-row scales (int8 only)
+    keys_offset      rows x 16-byte document content hashes
+
+Rows are L2-normalised before they are written. int8 rows are quantised
+symmetrically with one scale per row. Opening a store maps the file with
+numpy.memmap, so startup cost does not depend on corpus size and processes
+on the same host share the page cache. Indexing a store returns dequantised
+float32 rows for just the requested slice or ids.
+"""
+
+import os
+import json
+import struct
+import numpy as np
+from pathlib import Path
+
+MAGIC = b"RCPEMB01"
+HEADER_BYTES = 4096
+ALIGN = 64
+KEY_BYTES = 16
+STORE_DTYPES = ("float16", "int8")
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def _layout(rows, dim, dtype):
+    data_offset = HEADER_BYTES
+    scales_offset = _align(data_offset + rows * dim * np.dtype(dtype).itemsize)
+    scales_bytes = rows * 4 if dtype == "int8" else 0
+    keys_offset = _align(scales_offset + scales_bytes)
+    return data_offset, scales_offset, keys_offset, keys_offset + rows * KEY_BYTES
+
+def _map(path, dtype, offset, shape, mode):
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape)
+
+def quantize_int8(vectors):
+    """Symmetric per-row int8 quantisation; returns (values, scales)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    values = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return values, scales.astype(np.float32)
+
+class EmbeddingStoreWriter:
+    """
+    Writes a store of known size row block by row block into a temporary
+    file, which replaces `path` atomically on close().
+    """
+
+    def __init__(self, path, rows, dim, model, dtype="float16"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported store dtype: {dtype}")
+
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.rows = rows
+        self.dim = dim
+        self.model = model
+        self.dtype = dtype
+
+        data_offset, scales_offset, keys_offset, total = _layout(rows, dim, dtype)
+        self.header = {
+            "model": model,
+            "dtype": dtype,
+            "rows": rows,
+            "dim": dim,
+            "data_offset": data_offset,
+            "scales_offset": scales_offset,
+            "keys_offset": keys_offset,
+        }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.tmp_path, "wb") as f:
+            f.truncate(total)
+
+        self._data = _map(self.tmp_path, dtype, data_offset, (rows, dim), "r+")
+        self._scales = _map(self.tmp_path, np.float32, scales_offset, (rows,), "r+") if dtype == "int8" else None
+        self._keys = _map(self.tmp_path, f"S{KEY_BYTES}", keys_offset, (rows,), "r+")
+
+    def set_keys(self, keys):
+        """Record the content hash (hex) of every row."""
+        self._keys[:] = [bytes.fromhex(k) for k in keys]
+
+    def write(self, rows, vectors, keys=None):
+        """Write normalised float32 `vectors` at `rows` (a slice or an id array)."""
+        if self.dtype == "int8":
+            values, scales = quantize_int8(vectors)
+            self._data[rows] = values
+            self._scales[rows] = scales
+        else:
+            self._data[rows] = np.asarray(vectors, dtype=np.float16)
+        if keys is not None:
+            self._keys[rows] = [bytes.fromhex(k) for k in keys]
+
+    def close(self, fingerprint):
+        for array in (self._data, self._scales, self._keys):
+            if isinstance(array, np.memmap):
+                array.flush()
+        self._data = self._scales = self._keys = None
+
+        header = json.dumps(dict(self.header, fingerprint=fingerprint)).encode("utf-8")
+        if len(MAGIC) + 4 + len(header) > HEADER_BYTES:
+            raise ValueError("Embedding store header too large")
+        with open(self.tmp_path, "r+b") as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, self.path)
+        return EmbeddingStore(self.path)
+
+def write_store(path, vectors, keys, model, fingerprint, dtype="float16"):
+    """Write a complete in-memory embedding matrix to a store file."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    writer = EmbeddingStoreWriter(path, len(vectors), vectors.shape[1], model, dtype=dtype)
+    writer.write(slice(None), vectors, keys)
+    return writer.close(fingerprint)
+
+class EmbeddingStore:
+    """Read-only, zero-copy view of a store file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not an embedding store")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len))
+
+        self.model = header["model"]
+        self.dtype = header["dtype"]
+        self.fingerprint = header["fingerprint"]
+        self.dim = header["dim"]
+        rows = header["rows"]
+
+        self._data = _map(self.path, self.dtype, header["data_offset"], (rows, self.dim), "r")
+        self._scales = None
+        if self.dtype == "int8":
+            self._scales = _map(self.path, np.float32, header["scales_offset"], (rows,), "r")
+        self._keys = _map(self.path, f"S{KEY_BYTES}", header["keys_offset"], (rows,), "r")
+
+    @classmethod
+    def open(cls, path):
+        """Open a store, or return None if the file is missing or not a store."""
+        try:
+            return cls(path)
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable embedding store {path}: {e}")
+            return None
+
+    @property
+    def shape(self):
+        return (len(self._data), self.dim)
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        """Document content hashes, one per row, as hex strings."""
+        return [key.ljust(KEY_BYTES, b"\0").hex() for key in self._keys]
+
+    def __getitem__(self, rows):
+        """Dequantised float32 rows; only the selected rows are read."""
+        values = np.asarray(self._data[rows], dtype=np.float32)
+        if self._scales is not None:
+            values *= np.asarray(self._scales[rows], dtype=np.float32)[..., None]
+        return values
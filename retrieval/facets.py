@@ -0,0 +1,66 @@
+"""
+Precomputed metadata facets for filtered retrieval.
+
+For every facet field (`category` from extract_recipes, `categories` and
+`constraint` from extract_allergens) the index keeps one sorted int32 array
+of row ids per value. A filter such as
+{"category": "pizza", "constraint": "gluten-free"} resolves to the eligible
+row ids by intersecting those arrays, before any document is scored.
+"""
+
+import numpy as np
+
+FACET_FIELDS = ("category", "categories", "constraint")
+
+def normalize_facet_value(value):
+    """'Gluten-Free' and 'gluten_free' are the same facet value."""
+    return str(value).strip().lower().replace("-", "_")
+
+class FacetIndex:
+    def __init__(self, num_docs, postings):
+        self.num_docs = num_docs
+        self.postings = postings
+
+    @classmethod
+    def build(cls, recipes, fields=FACET_FIELDS):
+        """Index an iterable of recipe dicts (only the facet fields are read)."""
+        rows = {field: {} for field in fields}
+        num_docs = 0
+        for row_id, recipe in enumerate(recipes):
+            num_docs += 1
+            for field in fields:
+                values = recipe.get(field)
+                if values is None:
+                    continue
+                if isinstance(values, str) or not hasattr(values, "__iter__"):
+                    values = [values]
+                for value in values:
+                    rows[field].setdefault(normalize_facet_value(value), []).append(row_id)
+
+        postings = {
+            field: {value: np.array(ids, dtype=np.int32) for value, ids in by_value.items()}
+            for field, by_value in rows.items()
+        }
+        return cls(num_docs, postings)
+
+    def values(self, field):
+        """Known values of a facet with their document counts."""
+        return {value: len(ids) for value, ids in self.postings.get(field, {}).items()}
+
+    def select(self, filters):
+        """
+        Sorted row ids matching every facet in `filters` (AND across facets).
+        A list of values for one facet matches any of them (OR).
+        """
+        eligible = None
+        for field, wanted in filters.items():
+            if field not in self.postings:
+                raise ValueError(f"Unknown filter facet: {field} (known: {', '.join(self.postings)})")
+            if isinstance(wanted, str) or not hasattr(wanted, "__iter__"):
+                wanted = [wanted]
+
+            by_value = self.postings[field]
+            matches = [by_value[v] for v in map(normalize_facet_value, wanted) if v in by_value]
+            ids = np.unique(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int32)
+            eligible = ids if eligible is None else np.intersect1d(eligible, ids, assume_unique=True)
+        return eligible
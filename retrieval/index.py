@@ -0,0 +1,233 @@
+"""
+Nearest-neighbour index backends for RecipeRetriever.
+
+ExactIndex scores every document and is the right choice for the small
+curated case base. IVFIndex clusters the corpus with spherical k-means and
+only scores the `nprobe` closest clusters per query, which is what makes the
+full RecipeNLG corpus searchable. `nprobe` is the recall-vs-latency knob:
+higher values scan more clusters, find more of the exact top-k and take longer.
+
+All backends expect L2-normalised vectors, so a dot product is the cosine
+similarity. `vectors` may be an in-memory array or a memory-mapped
+EmbeddingStore; backends only ever read it a block or a candidate set at a time.
+"""
+
+import time
+import hashlib
+import numpy as np
+from pathlib import Path
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 100_000
+ASSIGN_BLOCK_SIZE = 4096
+SCORE_BLOCK_SIZE = 16384
+
+def normalize(vectors):
+    """L2-normalise rows (or a single vector) as float32."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def embeddings_fingerprint(vectors):
+    """Cheap fingerprint of an embedding matrix, used to detect stale index files."""
+    step = max(1, len(vectors) // 1024)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.array(vectors.shape, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(vectors[::step], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+def top_k(scores, k):
+    """Indices of the k largest scores per row, best first, via partial selection."""
+    k = min(k, scores.shape[-1])
+    if k < scores.shape[-1]:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(k), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+def search_subset(vectors, query, k, ids):
+    """Exact search restricted to the documents in `ids`; returns (scores, ids)."""
+    # Sorted ids keep reads from a memory-mapped store sequential
+    ids = np.sort(np.asarray(ids, dtype=np.int64))
+    scores = vectors[ids] @ query if len(ids) else np.zeros(0, dtype=np.float32)
+    best = top_k(scores, k)
+    return scores[best], ids[best]
+
+class ExactIndex:
+    """Brute-force cosine search over every document."""
+
+    name = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, vectors):
+        return cls(vectors)
+
+    def search(self, query, k):
+        """Return (scores, ids) of the k best documents for one normalised query."""
+        scores, ids = self.search_many(query[None, :], k)
+        return scores[0], ids[0]
+
+    def search_many(self, queries, k, ids=None):
+        """
+        Score a batch of queries with one matrix multiply per block of documents,
+        keeping a running top-k; returns per-query (scores, ids).
+
+        If `ids` (sorted row ids) is given, only those documents are scored.
+        """
+        n = len(self.vectors) if ids is None else len(ids)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, n, SCORE_BLOCK_SIZE):
+            if ids is None:
+                block_ids = np.arange(start, min(start + SCORE_BLOCK_SIZE, n))
+                block = self.vectors[start:start + SCORE_BLOCK_SIZE]
+            else:
+                block_ids = np.asarray(ids[start:start + SCORE_BLOCK_SIZE], dtype=np.int64)
+                block = self.vectors[block_ids]
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            block_ids = np.concatenate([best_ids, np.broadcast_to(block_ids, (len(queries), len(block_ids)))], axis=1)
+            best = top_k(scores, k)
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            best_ids = np.take_along_axis(block_ids, best, axis=1)
+        return list(best_scores), list(best_ids)
+
+class IVFIndex:
+    """Inverted-file index: documents are bucketed by their nearest centroid."""
+
+    name = "ivf"
+
+    def __init__(self, vectors, centroids, list_offsets, list_ids, nprobe=DEFAULT_NPROBE, fingerprint=None):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+        self.fingerprint = fingerprint
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, nlist=None, nprobe=DEFAULT_NPROBE, seed=0, fingerprint=None):
+        """
+        Train centroids on a sample of the corpus and bucket every vector.
+
+        `fingerprint` identifies the embeddings the index belongs to; it defaults
+        to a hash of the vectors themselves.
+        """
+        n = len(vectors)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, max(KMEANS_SAMPLE_SIZE, 40 * nlist))
+        sample = vectors[np.sort(rng.choice(n, size=sample_size, replace=False))]
+
+        print(f"Training IVF index ({nlist} lists on {sample_size} vectors)...")
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+
+            # Re-seed empty clusters with random sample points
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = sample[rng.choice(sample_size, size=len(empty), replace=False)]
+            centroids = normalize(sums)
+
+        assignment = _assign(vectors, centroids)
+        list_ids = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=list_offsets[1:])
+
+        return cls(vectors, centroids, list_offsets, list_ids, nprobe=nprobe,
+                   fingerprint=fingerprint or embeddings_fingerprint(vectors))
+
+    def search(self, query, k, nprobe=None, mask=None):
+        """
+        Return (scores, ids) of the k best documents among the probed lists.
+        `mask` is an optional boolean array over all documents; unmasked ones are never scored.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe = np.argsort(-(self.centroids @ query))[:nprobe]
+        candidates = np.concatenate([
+            self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+        ])
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        scores = self.vectors[candidates] @ query
+        best = top_k(scores, k)
+        return scores[best], candidates[best]
+
+    def search_many(self, queries, k, nprobe=None, mask=None):
+        """Search a batch of queries; each probes its own lists, so results are per query."""
+        results = [self.search(q, k, nprobe=nprobe, mask=mask) for q in queries]
+        return [r[0] for r in results], [r[1] for r in results]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_ids=self.list_ids,
+                fingerprint=np.array(self.fingerprint or ""),
+            )
+
+    @classmethod
+    def load(cls, path, vectors, nprobe=DEFAULT_NPROBE, fingerprint=None):
+        """Load a saved index, or return None if it was built for other vectors."""
+        fingerprint = fingerprint or embeddings_fingerprint(vectors)
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            return cls(vectors, data["centroids"], data["list_offsets"], data["list_ids"],
+                       nprobe=nprobe, fingerprint=fingerprint)
+
+def _assign(vectors, centroids):
+    """Nearest centroid for every row, computed in blocks to bound memory."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+def recall_sweep(index, queries, k=10, nprobe_values=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Measure recall@k and latency of an IVFIndex against exact search
+    for a range of nprobe settings.
+    """
+    exact = ExactIndex(index.vectors)
+    truth = [set(exact.search(q, k)[1].tolist()) for q in queries]
+
+    report = []
+    for nprobe in nprobe_values:
+        hits = 0
+        start = time.perf_counter()
+        found = [index.search(q, k, nprobe=nprobe)[1] for q in queries]
+        elapsed = time.perf_counter() - start
+        for ids, expected in zip(found, truth):
+            hits += len(expected.intersection(ids.tolist()))
+        report.append({
+            "nprobe": nprobe,
+            f"recall@{k}": round(hits / (k * len(queries)), 4),
+            "ms_per_query": round(1000 * elapsed / len(queries), 3),
+        })
+    return report
+
+INDEX_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
@@ -0,0 +1,68 @@
+"""
+Persistent, LRU-bounded cache of query embeddings.
+
+Experiment dish lists are the same strings run after run, so their
+embeddings are kept on disk keyed by (model, normalised query text).
+A warm cache lets RecipeRetriever answer queries without loading the
+sentence-transformer at all.
+"""
+
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10_000
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query used as the cache key."""
+    return " ".join(text.lower().split())
+
+class QueryEmbeddingCache:
+    def __init__(self, path, model_name, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._load()
+
+    def _key(self, query):
+        return f"{self.model_name}\t{normalize_query(query)}"
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with np.load(self.path) as data:
+            for key, vector in zip(data["keys"].tolist(), data["vectors"]):
+                self.entries[key] = vector
+
+    def get(self, query):
+        """Cached embedding for `query`, or None; a hit marks the entry recently used."""
+        key = self._key(query)
+        vector = self.entries.get(key)
+        if vector is not None:
+            self.entries.move_to_end(key)
+        return vector
+
+    def put(self, query, vector):
+        key = self._key(query)
+        self.entries[key] = np.asarray(vector, dtype=np.float32)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def save(self):
+        """Write the cache to disk if anything changed since the last save."""
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                keys=np.array(list(self.entries.keys()), dtype=str),
+                vectors=np.stack(list(self.entries.values())),
+            )
+        tmp_path.replace(self.path)
+        self.dirty = False
@@ -1,73 +1,328 @@
 import json
-import torch
+import atexit
+import hashlib
+import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer, util
+from retrieval.index import ExactIndex, IVFIndex, DEFAULT_NPROBE, normalize, search_subset
+from retrieval.bm25 import BM25Index, reciprocal_rank_fusion
+from retrieval.facets import FacetIndex
+from retrieval.documents import normalize_recipe, build_document, document_key
+from retrieval.recipe_store import RecipeStore, LazyDocuments
+from retrieval.embedding_store import EmbeddingStore, EmbeddingStoreWriter
+from retrieval.query_cache import QueryEmbeddingCache, DEFAULT_MAX_ENTRIES, normalize_query
+from evaluation.profiler import span, profiled
 
 DATA_PATH = Path("data/recipes.json")
-EMBEDDINGS_CACHE_PATH = Path("data/embeddings_cache.pt")
+EMBEDDINGS_CACHE_PATH = Path("data/embeddings_cache.emb")
+EMBEDDING_MODEL = "Alibaba-NLP/gte-large-en-v1.5"
+
+# Rows copied per step when carrying cached embeddings into a rewritten store
+COPY_BLOCK_SIZE = 16384
+
+# Corpora at least this large use the approximate IVF index when index="auto"
+APPROX_INDEX_MIN_DOCS = 100_000
+
+# dense: embeddings only; bm25: lexical only; hybrid: reciprocal rank fusion of both;
+# rerank: BM25 shortlist re-scored with embeddings
+RETRIEVAL_MODES = ("dense", "bm25", "hybrid", "rerank")
+RRF_DEPTH = 50
+RERANK_CANDIDATES = 200
+
+# Filtered searches over at most this many eligible documents skip the ANN index
+# and score the eligible subset exactly
+EXACT_FILTER_MAX_DOCS = 50_000
+
+def cache_fingerprint(model_name, keys):
+    """Fingerprint of an embedding cache: the model plus the ordered document hashes."""
+    digest = hashlib.blake2b(model_name.encode("utf-8"), digest_size=16)
+    for key in keys:
+        digest.update(bytes.fromhex(key))
+    return digest.hexdigest()
 
 class RecipeRetriever:
-    def __init__(self, data_path=DATA_PATH, cache_path=EMBEDDINGS_CACHE_PATH):
-        with open(data_path, "r") as f:
-            data = json.load(f)
-
-        self.recipes = data["recipes"]
-        self.cache_path = cache_path
-
-        # normalize ingredients and steps
-        for r in self.recipes:
-            if isinstance(r.get("ingredients"), str):
-                r["ingredients"] = json.loads(r["ingredients"])
-
-            if isinstance(r.get("steps"), str):
-                r["steps"] = json.loads(r["steps"])
-
-        # Build searchable documents
-        self.documents = []
-        for r in self.recipes:
-            text = (
-                r.get("dish_name", "") + " "
-                + " ".join(r.get("ingredients", [])) + " "
-                + " ".join(r.get("steps", []))
-            )
-            self.documents.append(text)
-
-        self.model = SentenceTransformer('Alibaba-NLP/gte-large-en-v1.5', trust_remote_code=True)
-        self.doc_embeddings = self._load_or_compute_embeddings()
+    def __init__(self, data_path=DATA_PATH, cache_path=EMBEDDINGS_CACHE_PATH,
+                 index="auto", nprobe=DEFAULT_NPROBE, store_dtype="float16",
+                 query_cache_size=DEFAULT_MAX_ENTRIES):
+        self.cache_path = Path(cache_path)
+        self.store_dtype = store_dtype
+
+        with span("retriever.load_recipes"):
+            store_path = self._recipe_store_path(Path(data_path))
+            if store_path is not None:
+                # Columnar store: only the content keys are read up front, recipes and
+                # documents are materialised per row on access
+                self.recipes = RecipeStore(store_path)
+                self.documents = LazyDocuments(self.recipes)
+                self.doc_keys = self.recipes.doc_keys()
+            else:
+                with open(data_path, "r") as f:
+                    data = json.load(f)
+
+                self.recipes = data["recipes"]
+
+                # normalize ingredients and steps
+                for r in self.recipes:
+                    normalize_recipe(r)
+
+                # Build searchable documents
+                self.documents = [build_document(r) for r in self.recipes]
+                self.doc_keys = [document_key(d) for d in self.documents]
+
+        self.fingerprint = cache_fingerprint(EMBEDDING_MODEL, self.doc_keys)
+
+        # The encoder is only loaded on the first embedding cache miss
+        self._model = None
+        self.query_cache = QueryEmbeddingCache(
+            self.cache_path.with_suffix(".queries.npz"), EMBEDDING_MODEL, max_entries=query_cache_size
+        )
+        # save() rewrites the whole file, so it runs once at exit rather than per batch of misses
+        atexit.register(self.query_cache.save)
+
+        with span("retriever.load_embeddings"):
+            self.doc_embeddings = self._load_or_compute_embeddings()
+        with span("retriever.load_index", backend=index):
+            self.index = self._load_or_build_index(index, nprobe)
+        self._lexical_index = None
+        self._facets = None
+        self._dish_rows = None
+
+    @staticmethod
+    def _recipe_store_path(data_path):
+        """The SQLite recipe store to read, or None to fall back to the JSON file."""
+        if data_path.suffix == ".sqlite":
+            return data_path
+        store_path = data_path.with_suffix(".sqlite")
+        if not store_path.exists():
+            return None
+        if data_path.exists() and data_path.stat().st_mtime > store_path.stat().st_mtime:
+            print(f"{store_path} is older than {data_path}, reading the JSON file instead...")
+            return None
+        return store_path
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            print(f"Loading embedding model {EMBEDDING_MODEL}...")
+            with span("retriever.model_load"):
+                self._model = SentenceTransformer(EMBEDDING_MODEL, trust_remote_code=True)
+        return self._model
+
+    def _encode_queries(self, queries):
+        """Normalised query embeddings, encoding only queries missing from the query cache."""
+        vectors = [self.query_cache.get(q) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing:
+            unique = list({normalize_query(queries[i]): queries[i] for i in missing}.values())
+            model = self.model
+            with span("retriever.encode_queries", queries=len(unique)):
+                encoded = normalize(model.encode(unique, convert_to_numpy=True))
+            for query, vector in zip(unique, encoded):
+                self.query_cache.put(query, vector)
+            # Fill misses from the encoder output: the LRU may already have evicted them
+            by_query = {normalize_query(q): v for q, v in zip(unique, encoded)}
+            for i in missing:
+                vectors[i] = by_query[normalize_query(queries[i])]
+
+        return np.stack(vectors)
 
     def _load_or_compute_embeddings(self):
-        """Load cached embeddings or compute and cache them."""
-        if self.cache_path.exists():
+        """
+        Open the memory-mapped embedding store, re-embedding only documents that
+        are new or changed.
+
+        The store records the model id and one content hash per row; rows whose
+        document no longer exists are dropped when the store is rewritten.
+        """
+        store = self._open_store()
+        if store is not None and store.fingerprint == self.fingerprint and store.dtype == self.store_dtype:
             print("Loading cached embeddings...")
-            return torch.load(self.cache_path)
-        
-        print("Computing embeddings (this may take a while)...")
-        embeddings = self.model.encode(self.documents, convert_to_tensor=True)
-        
-        # Ensure cache directory exists
-        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
-        torch.save(embeddings, self.cache_path)
+            return store
+
+        cached_rows = {}
+        if store is not None:
+            cached_rows = {key: row for row, key in enumerate(store.keys())}
+
+        missing = [i for i, key in enumerate(self.doc_keys) if key not in cached_rows]
+        if len(missing) == len(self.documents):
+            print("Computing embeddings (this may take a while)...")
+        else:
+            print(f"Updating cached embeddings ({len(missing)} new or changed documents)...")
+
+        fresh = None
+        if missing:
+            if len(missing) == len(self.documents):
+                texts = list(self.documents)
+            else:
+                texts = [self.documents[i] for i in missing]
+            model = self.model
+            with span("retriever.encode_documents", documents=len(texts)):
+                fresh = normalize(model.encode(texts, convert_to_numpy=True))
+        dim = fresh.shape[1] if fresh is not None else store.dim
+
+        writer = EmbeddingStoreWriter(self.cache_path, len(self.documents), dim,
+                                      EMBEDDING_MODEL, dtype=self.store_dtype)
+        if missing:
+            writer.write(np.array(missing), fresh)
+
+        reused = np.array([i for i, key in enumerate(self.doc_keys) if key in cached_rows], dtype=np.int64)
+        source = np.array([cached_rows[self.doc_keys[i]] for i in reused], dtype=np.int64)
+        for start in range(0, len(reused), COPY_BLOCK_SIZE):
+            block = slice(start, start + COPY_BLOCK_SIZE)
+            writer.write(reused[block], store[source[block]])
+
+        writer.set_keys(self.doc_keys)
+        store = writer.close(self.fingerprint)
         print(f"Embeddings cached to {self.cache_path}")
-        
-        return embeddings
 
-    def retrieve(self, query, k=1):
+        return store
+
+    def _open_store(self):
+        """Return the embedding store if usable for the current model, else None."""
+        store = EmbeddingStore.open(self.cache_path)
+        if store is not None and store.model != EMBEDDING_MODEL:
+            print(f"Embedding cache was built with {store.model}, re-embedding...")
+            return None
+        return store
+
+    def _load_or_build_index(self, backend, nprobe):
+        """Set up the search backend; the IVF index is built once and saved next to the cache."""
+        vectors = self.doc_embeddings
+
+        if backend == "auto":
+            backend = "ivf" if len(vectors) >= APPROX_INDEX_MIN_DOCS else "exact"
+
+        if backend == "exact":
+            return ExactIndex.build(vectors)
+
+        if backend != "ivf":
+            raise ValueError(f"Unknown index backend: {backend}")
+
+        index_path = self.cache_path.with_suffix(".ivf.npz")
+        if index_path.exists():
+            index = IVFIndex.load(index_path, vectors, nprobe=nprobe, fingerprint=self.fingerprint)
+            if index is not None:
+                print("Loading cached IVF index...")
+                return index
+            print("Cached IVF index does not match the embeddings, rebuilding...")
+
+        index = IVFIndex.build(vectors, nprobe=nprobe, fingerprint=self.fingerprint)
+        index.save(index_path)
+        print(f"IVF index cached to {index_path}")
+        return index
+
+    @property
+    def lexical_index(self):
+        """BM25 index over the same documents, built on first use and cached next to the store."""
+        if self._lexical_index is None:
+            path = self.cache_path.with_suffix(".bm25.npz")
+            if path.exists():
+                self._lexical_index = BM25Index.load(path, self.fingerprint)
+            if self._lexical_index is None:
+                print("Building BM25 index...")
+                self._lexical_index = BM25Index.build(self.documents, fingerprint=self.fingerprint)
+                self._lexical_index.save(path)
+                print(f"BM25 index cached to {path}")
+        return self._lexical_index
+
+    @property
+    def facets(self):
+        """Per-facet sorted row-id arrays, built on the first filtered query."""
+        if self._facets is None:
+            if isinstance(self.recipes, RecipeStore):
+                self._facets = FacetIndex.build(self.recipes.facet_records())
+            else:
+                self._facets = FacetIndex.build(self.recipes)
+        return self._facets
+
+    @property
+    def dish_rows(self):
+        """dish_id -> row in `recipes` / `doc_embeddings`, built on first use."""
+        if self._dish_rows is None:
+            if isinstance(self.recipes, RecipeStore):
+                dish_ids = self.recipes.dish_ids()
+            else:
+                dish_ids = [str(r.get("dish_id", "")) for r in self.recipes]
+            self._dish_rows = {dish_id: row for row, dish_id in enumerate(dish_ids)}
+        return self._dish_rows
+
+    def retrieve(self, query, k=1, mode="dense", filters=None):
         """
         Returns the k most similar recipes as tuples of (formatted_string, dish_id, dish_name)
         suitable for prompt injection.
+
+        `filters` restricts the search to matching recipes before scoring, e.g.
+        {"category": "pizza"} or {"constraint": "gluten-free"}.
+        """
+        return self.retrieve_many([query], k, mode=mode, filters=filters)[0]
+
+    def retrieve_many(self, queries, k=1, mode="dense", filters=None):
+        """
+        Batched version of retrieve: encodes all queries in one call and scores them
+        against the corpus together. Returns one result list per query, in order.
         """
+        queries = list(queries)
+        with span("retriever.search", mode=mode, queries=len(queries), k=k):
+            best_indices = self._search(queries, k, mode, filters)
+
+        with span("retriever.format"):
+            return [
+                [self._as_result(self.recipes[i]) for i in indices]
+                for indices in best_indices
+            ]
+
+    def _search(self, queries, k, mode, filters=None):
+        """Row ids of the k best documents per query for the given retrieval mode."""
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+
+        eligible = mask = None
+        if filters:
+            eligible = self.facets.select(filters)
+            if len(eligible) == 0:
+                return [[] for _ in queries]
+            mask = np.zeros(len(self.documents), dtype=bool)
+            mask[eligible] = True
+
+        if mode == "bm25":
+            return [self.lexical_index.search(q, k, mask)[1] for q in queries]
+
+        query_embeddings = self._encode_queries(queries)
+
+        if mode == "dense":
+            return self._dense_search(query_embeddings, k, eligible, mask)
 
-        query_embedding = self.model.encode(query, convert_to_tensor=True)
+        if mode == "hybrid":
+            depth = max(k, RRF_DEPTH)
+            dense = self._dense_search(query_embeddings, depth, eligible, mask)
+            return [
+                reciprocal_rank_fusion([dense_ids, self.lexical_index.search(q, depth, mask)[1]], k)[1]
+                for q, dense_ids in zip(queries, dense)
+            ]
 
-        scores = util.cos_sim(query_embedding, self.doc_embeddings)[0]
+        # rerank: only the lexical shortlist is scored densely
+        best = []
+        for query, embedding in zip(queries, query_embeddings):
+            shortlist = self.lexical_index.search(query, max(k, RERANK_CANDIDATES), mask)[1]
+            if len(shortlist):
+                best.append(search_subset(self.doc_embeddings, embedding, k, shortlist)[1])
+            else:
+                best.append(self._dense_search(embedding[None, :], k, eligible, mask)[0])
+        return best
 
-        best_indices = scores.argsort(descending=True)[:k].cpu().numpy()
-        recipes = [self.recipes[i] for i in best_indices]
+    @profiled("retriever.score")
+    def _dense_search(self, query_embeddings, k, eligible=None, mask=None):
+        """Embedding search, restricted to the eligible documents when a filter is active."""
+        if eligible is None:
+            return self.index.search_many(query_embeddings, k)[1]
+        if isinstance(self.index, ExactIndex) or len(eligible) <= EXACT_FILTER_MAX_DOCS:
+            return ExactIndex(self.doc_embeddings).search_many(query_embeddings, k, ids=eligible)[1]
+        return self.index.search_many(query_embeddings, k, mask=mask)[1]
 
-        return [
-            (self.format_recipe(r), r.get("dish_id", ""), r.get("dish_name", ""))
-            for r in recipes
-        ]
+    def _as_result(self, recipe):
+        return (self.format_recipe(recipe), recipe.get("dish_id", ""), recipe.get("dish_name", ""))
 
     def format_recipe(self, recipe):
         """
@@ -0,0 +1,166 @@
+"""
+Columnar SQLite recipe store with lazy record materialisation.
+
+The extract scripts write one next to their JSON output (recipes.json ->
+recipes.sqlite). Ingredients and steps are stored already parsed (as JSON
+arrays, never double-encoded strings) together with each recipe's document
+content hash. RecipeRetriever then only reads the doc_key column at
+startup and turns a row into a dict when it is actually retrieved.
+
+Convert an existing JSON case base with:
+    python -m retrieval.recipe_store data/recipes.json
+"""
+
+import sys
+import json
+import sqlite3
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.documents import normalize_recipe, build_document, document_key
+
+READ_BATCH_SIZE = 10_000
+
+COLUMNS = ("dish_id", "dish_name", "category", "categories", "constraint_name", "ingredients", "steps")
+JSON_COLUMNS = ("categories", "ingredients", "steps")
+
+SCHEMA = """
+CREATE TABLE recipes (
+    row_id INTEGER PRIMARY KEY,
+    dish_id TEXT,
+    dish_name TEXT,
+    category TEXT,
+    categories TEXT,
+    constraint_name TEXT,
+    ingredients TEXT,
+    steps TEXT,
+    doc_key TEXT NOT NULL
+);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def write_recipe_store(path, recipes, metadata=None):
+    """Write recipes (dicts as in recipes.json) to a fresh SQLite store."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(SCHEMA)
+
+    def rows():
+        for row_id, recipe in enumerate(recipes):
+            recipe = normalize_recipe(dict(recipe))
+            categories = recipe.get("categories")
+            yield (
+                row_id,
+                recipe.get("dish_id", ""),
+                recipe.get("dish_name", ""),
+                recipe.get("category"),
+                json.dumps(list(categories)) if categories is not None else None,
+                recipe.get("constraint"),
+                json.dumps(list(recipe.get("ingredients", []))),
+                json.dumps(list(recipe.get("steps", []))),
+                document_key(build_document(recipe)),
+            )
+
+    conn.executemany(f"INSERT INTO recipes VALUES ({', '.join('?' * 9)})", rows())
+    conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                     [(key, json.dumps(value)) for key, value in (metadata or {}).items()])
+    conn.commit()
+    conn.close()
+
+    tmp_path.replace(path)
+    return path
+
+def _to_recipe(row, columns=COLUMNS):
+    recipe = {}
+    for column, value in zip(columns, row):
+        if value is None:
+            continue
+        if column in JSON_COLUMNS:
+            value = json.loads(value)
+        recipe["constraint" if column == "constraint_name" else column] = value
+    return recipe
+
+class RecipeStore:
+    """Read-only sequence of recipes backed by the SQLite store."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # Read-only; the retrieval server reads from its batching thread
+        self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._len = self.conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, row_id):
+        row_id = int(row_id)
+        if not 0 <= row_id < self._len:
+            raise IndexError(row_id)
+        row = self.conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM recipes WHERE row_id = ?", (row_id,)
+        ).fetchone()
+        return _to_recipe(row)
+
+    def __iter__(self):
+        for batch in self._scan(COLUMNS):
+            for row in batch:
+                yield _to_recipe(row)
+
+    def _scan(self, columns):
+        cursor = self.conn.execute(f"SELECT {', '.join(columns)} FROM recipes ORDER BY row_id")
+        while True:
+            batch = cursor.fetchmany(READ_BATCH_SIZE)
+            if not batch:
+                return
+            yield batch
+
+    def doc_keys(self):
+        """Document content hashes in row order, without materialising any recipe."""
+        return [row[0] for batch in self._scan(("doc_key",)) for row in batch]
+
+    def dish_ids(self):
+        """dish_id of every recipe in row order."""
+        return [row[0] or "" for batch in self._scan(("dish_id",)) for row in batch]
+
+    def facet_records(self):
+        """Yield only the facet columns of every recipe, in row order."""
+        columns = ("category", "categories", "constraint_name")
+        for batch in self._scan(columns):
+            for row in batch:
+                yield _to_recipe(row, columns)
+
+class LazyDocuments:
+    """Searchable document texts of a RecipeStore, built on access."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, row_id):
+        return build_document(self.store[row_id])
+
+    def __iter__(self):
+        for recipe in self.store:
+            yield build_document(recipe)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a recipes JSON file to a SQLite recipe store")
+    parser.add_argument("source", type=Path, help="JSON file with a top-level 'recipes' list")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Store path (defaults to the source path with a .sqlite suffix)")
+    args = parser.parse_args()
+
+    with open(args.source, "r") as f:
+        data = json.load(f)
+    output = args.output or args.source.with_suffix(".sqlite")
+    write_recipe_store(output, data["recipes"])
+    print(f"Saved {len(data['recipes'])} recipes to {output}")
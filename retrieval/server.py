@@ -0,0 +1,193 @@
+"""
+Long-lived local retrieval service.
+
+Loads RecipeRetriever (model, embedding store and index) once and serves it
+over localhost HTTP, so experiment scripts stop paying the startup cost on
+every run. Concurrent requests are micro-batched: queries arriving within
+`max_wait_ms` of each other (up to `max_batch` of them) are encoded and
+scored in a single retrieve_many call.
+
+Usage:
+    python -m retrieval.server --port 8765
+    RETRIEVAL_SERVER_URL=http://127.0.0.1:8765 python generation/few_shot_RAG.py
+
+Endpoints (JSON over POST):
+    /retrieve       {"query": str, "k": int, "mode": str, "filters": {...}}
+                    -> {"results": [[text, id, name], ...]}
+    /retrieve_many  {"queries": [str], "k": int, "mode": str, "filters": {...}}
+                    -> {"results": [[[text, id, name], ...], ...]}
+    /health         (GET) -> {"status": "ok", ...}
+"""
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.recipe_retriever import RecipeRetriever, RETRIEVAL_MODES
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 5
+
+class _Pending:
+    def __init__(self, queries, k, mode, filters):
+        self.queries = queries
+        self.k = k
+        self.mode = mode
+        self.filters = filters
+        self.group = (k, mode, json.dumps(filters, sort_keys=True))
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+class MicroBatcher:
+    """Collects queries from concurrent requests and answers them in batches."""
+
+    def __init__(self, retriever, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, queries, k, mode="dense", filters=None):
+        """Queue queries and block until their batch has been retrieved."""
+        item = _Pending(list(queries), k, mode, filters)
+        self.pending.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.results
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        size = len(batch[0].queries)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item.queries)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            # One retrieve_many call per distinct (k, mode, filters) in the batch
+            groups = {}
+            for item in batch:
+                groups.setdefault(item.group, []).append(item)
+
+            for items in groups.values():
+                first = items[0]
+                queries = [q for item in items for q in item.queries]
+                try:
+                    results = self.retriever.retrieve_many(queries, first.k, mode=first.mode,
+                                                           filters=first.filters)
+                except Exception as e:
+                    for item in items:
+                        item.error = e
+                        item.done.set()
+                    continue
+
+                self.batches += 1
+                self.queries += len(queries)
+                offset = 0
+                for item in items:
+                    item.results = results[offset:offset + len(item.queries)]
+                    offset += len(item.queries)
+                    item.done.set()
+
+def make_handler(batcher):
+    class RetrievalHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+                return
+            self._send(200, {
+                "status": "ok",
+                "documents": len(batcher.retriever.recipes),
+                "batches": batcher.batches,
+                "queries": batcher.queries,
+            })
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                k = int(request.get("k", 1))
+                mode = request.get("mode", "dense")
+                filters = request.get("filters")
+                if mode not in RETRIEVAL_MODES:
+                    raise ValueError(f"Unknown retrieval mode: {mode}")
+                if self.path == "/retrieve":
+                    results = batcher.submit([request["query"]], k, mode, filters)[0]
+                elif self.path == "/retrieve_many":
+                    results = batcher.submit(request["queries"], k, mode, filters)
+                else:
+                    self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+                    return
+            except (KeyError, ValueError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {"results": results})
+
+        def log_message(self, format, *args):
+            pass
+
+    return RetrievalHandler
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch=DEFAULT_MAX_BATCH,
+          max_wait_ms=DEFAULT_MAX_WAIT_MS, retriever=None):
+    retriever = retriever or RecipeRetriever()
+    batcher = MicroBatcher(retriever, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Retrieval server listening on http://{host}:{port} "
+          f"(max batch {max_batch}, max wait {max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RecipeRetriever over localhost HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Maximum number of queries encoded together")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long to wait for more queries before running a batch")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.max_batch, args.max_wait_ms)
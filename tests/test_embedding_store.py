@@ -0,0 +1,78 @@
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.index import normalize
+from retrieval.embedding_store import EmbeddingStore, write_store
+from retrieval.recipe_retriever import RecipeRetriever
+
+DIM = 8
+
+class FakeModel:
+    """Deterministic stand-in for the sentence-transformer that records what it encodes."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.stack([np.random.default_rng(sum(map(ord, t))).standard_normal(DIM) for t in texts])
+
+def make_recipes(path, names):
+    recipes = [{"dish_id": name.lower().replace(" ", "_"), "dish_name": name,
+                "ingredients": json.dumps([f"1 cup {name.lower()}"]), "steps": json.dumps(["Cook."])}
+               for name in names]
+    path.write_text(json.dumps({"recipes": recipes}))
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(RecipeRetriever, "model", property(lambda self: model))
+    return model
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_store_roundtrip(tmp_path, dtype):
+    vectors = normalize(np.random.default_rng(0).standard_normal((20, DIM)).astype(np.float32))
+    keys = [f"{i:032x}" for i in range(20)]
+    write_store(tmp_path / "store.emb", vectors, keys, "model", "fp", dtype=dtype)
+
+    store = EmbeddingStore.open(tmp_path / "store.emb")
+    assert (store.model, store.dtype, store.fingerprint, store.shape) == ("model", dtype, "fp", (20, DIM))
+    assert store.keys() == keys
+    assert np.allclose(store[np.arange(20)], vectors, atol=1e-2)
+    assert np.allclose(store[3:5], vectors[3:5], atol=1e-2)
+
+def test_retriever_reuses_store(tmp_path, model):
+    data_path = tmp_path / "recipes.json"
+    cache_path = tmp_path / "embeddings_cache.emb"
+    make_recipes(data_path, ["Chicken Curry", "Beef Stew", "Tomato Soup"])
+
+    first = RecipeRetriever(data_path, cache_path, index="exact")
+    assert len(model.encoded) == 3
+
+    model.encoded.clear()
+    second = RecipeRetriever(data_path, cache_path, index="exact")
+    assert model.encoded == []
+    assert np.array_equal(second.doc_embeddings[np.arange(3)], first.doc_embeddings[np.arange(3)])
+
+def test_retriever_reencodes_only_changed_recipes(tmp_path, model):
+    data_path = tmp_path / "recipes.json"
+    cache_path = tmp_path / "embeddings_cache.emb"
+    make_recipes(data_path, ["Chicken Curry", "Beef Stew", "Tomato Soup"])
+    first = RecipeRetriever(data_path, cache_path, index="exact")
+    before = first.doc_embeddings[np.arange(3)]
+
+    make_recipes(data_path, ["Chicken Curry", "Lamb Stew", "Tomato Soup"])
+    model.encoded.clear()
+    second = RecipeRetriever(data_path, cache_path, index="exact")
+
+    assert model.encoded == [second.documents[1]]
+    after = second.doc_embeddings[np.arange(3)]
+    assert np.array_equal(after[[0, 2]], before[[0, 2]])
+    assert EmbeddingStore.open(cache_path).keys() == second.doc_keys
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from retrieval.index import ExactIndex, IVFIndex, normalize, recall_sweep
+
+def clustered(n, dim=32, clusters=20, seed=0):
+    """Normalised vectors scattered around a few random directions, like topic clusters of recipes."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    return normalize(centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dim)))
+
+def test_exact_search_matches_brute_force():
+    vectors = clustered(500)
+    queries = clustered(10, seed=1)
+    scores, ids = ExactIndex(vectors).search_many(queries, 5)
+    for query, query_scores, query_ids in zip(queries, scores, ids):
+        expected = np.argsort(-(vectors @ query))[:5]
+        assert query_ids.tolist() == expected.tolist()
+        assert np.allclose(query_scores, vectors[expected] @ query)
+
+def test_exact_search_within_ids():
+    vectors = clustered(500)
+    subset = np.arange(0, 500, 7)
+    _, ids = ExactIndex(vectors).search_many(clustered(3, seed=1), 4, ids=subset)
+    assert all(set(query_ids.tolist()) <= set(subset.tolist()) for query_ids in ids)
+
+def test_ivf_recall():
+    vectors = clustered(2000)
+    index = IVFIndex.build(vectors, nlist=32)
+    report = {row["nprobe"]: row["recall@10"] for row in recall_sweep(index, clustered(50, seed=1),
+                                                                      nprobe_values=(8, 32))}
+    assert report[32] == 1.0
+    assert report[8] >= 0.9
+
+def test_ivf_save_and_load(tmp_path):
+    vectors = clustered(500)
+    index = IVFIndex.build(vectors, nlist=8)
+    index.save(tmp_path / "index.ivf.npz")
+
+    loaded = IVFIndex.load(tmp_path / "index.ivf.npz", vectors, nprobe=8)
+    query = clustered(1, seed=1)[0]
+    assert loaded.search(query, 10)[1].tolist() == index.search(query, 10, nprobe=8)[1].tolist()
+    assert IVFIndex.load(tmp_path / "index.ivf.npz", clustered(500, seed=2)) is None
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation.ingredient_grounding import IngredientIndex, normalize_ingredient
+
+def make_index(names):
+    index = IngredientIndex()
+    for name in names:
+        index.add(normalize_ingredient(name))
+    return index
+
+def test_match_longest_known_name():
+    index = make_index(["flour", "chicken breast", "breast"])
+    assert index.names[index.match("2 boneless chicken breasts, diced")] == "chicken breast"
+    assert index.names[index.match("1 duck breast")] == "breast"
+
+def test_match_stops_at_unknown_tokens():
+    index = make_index(["flour", "chicken breast"])
+    assert index.names[index.match("1 cup zzz flour")] == "flour"
+    assert index.match("2 flour zzz") is None
+    assert index.match("zzz") is None
+    assert index.match("") is None
+
+def test_match_out_of_order_tokens():
+    index = make_index(["chicken breast"])
+    assert index.match("breast chicken") is None
+    assert index.match("chicken") is None
+
+def test_score_with_unknown_ingredients():
+    index = make_index(["flour", "sugar"])
+    grounded, overlap = index.score(["1 cup flour", "1 cup zzz flour", "2 qqq zzz"])
+    assert grounded == 2 / 3
+    assert overlap is None
+
+def test_score_reference_overlap():
+    index = make_index(["flour", "sugar", "butter", "egg"])
+    index.recipe_bits["r1"] = index.ingredient_bits(["2 cups flour", "1 egg"])[1]
+    grounded, overlap = index.score(["1 cup flour", "2 eggs", "1 cup sugar", "1 zzz"], reference_id="r1")
+    assert grounded == 3 / 4
+    assert overlap == 2 / 3
+    assert index.score(["1 cup flour"], reference_id="unknown") == (1.0, None)
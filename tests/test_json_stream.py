@@ -0,0 +1,44 @@
+import sys
+import json
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from generation.json_stream import JSONObjectScanner
+
+RECIPE = {"ingredients": ["1 {cup} flour", "a \"pinch\" of salt", "back\\slash }"], "steps": [["nested"], {}]}
+
+def scan(pieces):
+    scanner = JSONObjectScanner()
+    for i, piece in enumerate(pieces):
+        if scanner.feed(piece):
+            return scanner, i
+    return scanner, None
+
+def test_closes_on_final_brace_for_any_split():
+    text = json.dumps(RECIPE)
+    for size in (1, 2, 3, 7, len(text)):
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        scanner, closed_at = scan(pieces)
+        assert closed_at == len(pieces) - 1
+        assert scanner.parse() == RECIPE
+
+def test_skips_preamble_and_trailing_text():
+    text = json.dumps(RECIPE)
+    scanner, closed_at = scan(["Here is the recipe: ", text, " Enjoy!", " {\"more\": 1}"])
+    assert closed_at == 1
+    assert scanner.text() == text
+    assert scanner.feed("ignored") is True
+    assert scanner.parse() == RECIPE
+
+def test_unclosed_or_invalid_object():
+    scanner, closed_at = scan(['{"ingredients": ["flour"', ', "}"'])
+    assert closed_at is None
+    assert not scanner.closed
+    assert scanner.parse() is None
+    assert scanner.text() == '{"ingredients": ["flour", "}"'
+
+    scanner, closed_at = scan(['{"ingredients": [flour]}'])
+    assert closed_at == 0
+    assert scanner.parse() is None
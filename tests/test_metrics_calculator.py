@@ -0,0 +1,68 @@
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import evaluation.metrics_calculator as metrics_calculator
+from evaluation.metrics_calculator import MetricsCalculator
+from generation.result_sink import JSONLResultWriter, jsonl_to_json
+
+HEADER = {"condition": "zero_shot", "model": "llama3.2:3b"}
+DISHES = ["Chicken Curry", "Beef Stew", "Tomato Soup", "Caesar Salad", "Pepperoni Pizza", "Chocolate Cake"]
+
+def output(i):
+    return json.dumps({"ingredients": [f"ingredient {j}" for j in range(3 + i % 4)],
+                       "steps": [f"step {j}" for j in range(2 + i % 3)]})
+
+@pytest.fixture
+def results(tmp_path):
+    """A JSONL run with a retried dish and a parse error, and its aggregate JSON."""
+    path = tmp_path / "zero_shot.jsonl"
+    with JSONLResultWriter(path, HEADER) as writer:
+        writer.write({"dish_name": "Tomato Soup", "output": "not json"})
+        for i in range(40):
+            writer.write({"dish_name": f"{DISHES[i % len(DISHES)]} {i}", "output": output(i)})
+        writer.write({"dish_name": "Tomato Soup", "output": "{\"ingredients\": [\"tomato\"]"})
+        writer.write({"dish_name": "Tomato Soup", "output": output(0)})
+    jsonl_to_json(path)
+    metrics_calculator._MEMO.clear()
+    return path
+
+def test_stream_matches_full_load(results, monkeypatch):
+    expected = MetricsCalculator(results.with_suffix(".json"), grounding=False).get_summary_stats()
+    assert expected["total_recipes"] == 41
+    assert expected["parsing_errors"] == 0
+
+    monkeypatch.setattr(metrics_calculator, "PARSE_CHUNK_SIZE", 8)
+    for path in (results, results.with_suffix(".json")):
+        metrics_calculator._MEMO.clear()
+        calculator = MetricsCalculator(path, stream=True, workers=2, grounding=False)
+        assert calculator.get_summary_stats() == expected
+        assert calculator.condition == "zero_shot"
+
+def test_summary_quantiles_and_categories(results):
+    stats = MetricsCalculator(results, stream=True, grounding=False).get_summary_stats()
+    assert list(stats["ingredients_quantiles"]) == ["p5", "p25", "p50", "p75", "p95"]
+    assert stats["ingredients_quantiles"]["p5"] >= stats["min_ingredients"]
+    assert stats["ingredients_quantiles"]["p95"] <= stats["max_ingredients"]
+    assert sum(c["total_recipes"] for c in stats["by_category"].values()) == stats["total_recipes"]
+    assert stats["by_category"]["soup"]["total_recipes"] == 8  # 7 numbered plus the retried dish
+    assert stats["by_category"]["pizza"]["total_recipes"] == 6
+
+def test_disk_memo_skips_parsing(results, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "metrics_cache"
+    expected = MetricsCalculator(results, stream=True, cache_dir=cache_dir, grounding=False).get_summary_stats()
+    assert len(list(cache_dir.glob("*.npz"))) == 1
+
+    def fail(chunk):
+        raise AssertionError("results were parsed again")
+
+    metrics_calculator._MEMO.clear()
+    monkeypatch.setattr(metrics_calculator, "_parse_chunk", fail)
+    calculator = MetricsCalculator(results, stream=True, cache_dir=cache_dir, grounding=False)
+    assert calculator.get_summary_stats() == expected
+    assert calculator.header == HEADER
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from generation.response_cache import ResponseCache, cache_key
+
+OPTIONS = {"temperature": 0.5, "num_predict": 800}
+
+def test_cache_key_ignores_option_order():
+    reordered = {"num_predict": 800, "temperature": 0.5}
+    assert cache_key("sha256:abc", "prompt", OPTIONS, seed=42) == cache_key("sha256:abc", "prompt", reordered, seed=42)
+
+def test_cache_key_covers_every_input():
+    base = cache_key("sha256:abc", "prompt", OPTIONS, seed=42, format="json")
+    assert cache_key("sha256:def", "prompt", OPTIONS, seed=42, format="json") != base
+    assert cache_key("sha256:abc", "prompt!", OPTIONS, seed=42, format="json") != base
+    assert cache_key("sha256:abc", "prompt", dict(OPTIONS, temperature=0.7), seed=42, format="json") != base
+    assert cache_key("sha256:abc", "prompt", OPTIONS, seed=43, format="json") != base
+    assert cache_key("sha256:abc", "prompt", OPTIONS, seed=42) != base
+
+def test_get_put_and_stats(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    assert cache.get("k1") is None
+    cache.put("k1", {"response": "hello"})
+    assert cache.get("k1") == {"response": "hello"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"], stats["entries"]) == (1, 1, 0.5, 1)
+    cache.close()
+
+def test_entries_persist_across_reopen(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    cache.put("k1", {"response": "hello"})
+    cache.close()
+
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    assert cache.get("k1") == {"response": "hello"}
+    assert cache.stats()["misses"] == 0
+    cache.close()
+
+def test_evicts_least_recently_used(tmp_path):
+    entry = {"response": "x" * 100}
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=250)
+    cache.put("k1", entry)
+    cache.put("k2", entry)
+    cache.get("k1")  # k2 is now the least recently used
+    cache.put("k3", entry)
+
+    assert cache.get("k2") is None
+    assert cache.get("k1") == entry
+    assert cache.get("k3") == entry
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size_bytes"] <= 250
+    cache.close()
@@ -0,0 +1,75 @@
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from generation.result_sink import JSONLResultWriter, iter_results, jsonl_to_json, read_records
+
+HEADER = {"condition": "zero_shot", "model": "llama3.2:3b", "timestamp": "2024-01-01T00:00:00"}
+
+def write_run(path, results, header=HEADER):
+    with JSONLResultWriter(path, header) as writer:
+        for result in results:
+            writer.write(result)
+
+def test_resume_skips_completed_dishes(tmp_path):
+    path = tmp_path / "zero_shot.jsonl"
+    write_run(path, [{"dish_name": "Pizza", "output": "{}"},
+                     {"dish_name": "Soup", "output": "", "error": "timeout"}])
+
+    with JSONLResultWriter(path, HEADER, resume=True) as writer:
+        assert writer.completed == {"Pizza"}
+        writer.write({"dish_name": "Soup", "output": "{}"})
+
+    header, results, _, _ = read_records(path)
+    assert header == HEADER
+    assert [r["dish_name"] for r in results] == ["Pizza", "Soup", "Soup"]
+
+def test_resume_truncates_torn_line(tmp_path):
+    path = tmp_path / "zero_shot.jsonl"
+    write_run(path, [{"dish_name": "Pizza", "output": "{}"}])
+    with open(path, "ab") as f:
+        f.write(b'{"dish_name": "Sou')
+
+    with JSONLResultWriter(path, HEADER, resume=True) as writer:
+        assert writer.completed == {"Pizza"}
+        writer.write({"dish_name": "Soup", "output": "{}"})
+
+    lines = path.read_bytes().splitlines()
+    assert [json.loads(line) for line in lines][1:] == [{"dish_name": "Pizza", "output": "{}"},
+                                                         {"dish_name": "Soup", "output": "{}"}]
+
+def test_resume_checks_header(tmp_path):
+    path = tmp_path / "zero_shot.jsonl"
+    write_run(path, [])
+
+    with JSONLResultWriter(path, dict(HEADER, timestamp="2024-01-02T00:00:00"), resume=True):
+        pass
+    with pytest.raises(ValueError):
+        JSONLResultWriter(path, dict(HEADER, model="other"), resume=True)
+
+def test_jsonl_to_json_latest_record_wins(tmp_path):
+    path = tmp_path / "zero_shot.jsonl"
+    write_run(path, [{"dish_name": "Soup", "error": "timeout"},
+                     {"dish_name": "Pizza", "output": "{}"},
+                     {"dish_name": "Soup", "output": "{}"}])
+
+    outputs = jsonl_to_json(path, order=["Soup", "Pizza"])
+    assert outputs["condition"] == "zero_shot"
+    assert outputs["results"] == [{"dish_name": "Soup", "output": "{}"}, {"dish_name": "Pizza", "output": "{}"}]
+    assert json.loads(path.with_suffix(".json").read_text()) == outputs
+
+def test_iter_results_reads_both_formats(tmp_path):
+    path = tmp_path / "zero_shot.jsonl"
+    results = [{"dish_name": f"Dish {i}", "output": json.dumps({"steps": ["a" * i]})} for i in range(50)]
+    write_run(path, results)
+    jsonl_to_json(path)
+
+    for source in (path, path.with_suffix(".json")):
+        header = {}
+        assert list(iter_results(source, header)) == results
+        assert header == HEADER
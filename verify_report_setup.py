@@ -48,7 +48,7 @@ def main():
     print("\n📊 DATA & CONFIGURATION:")
     data_files = [
         (base_path / "data" / "recipes.json", "Recipe dataset"),
-        (base_path / "data" / "embeddings_cache.pt", "Embedding cache"),
+        (base_path / "data" / "embeddings_cache.emb", "Embedding cache"),
         (base_path / "retrieval" / "recipe_retriever.py", "Retrieval system"),
     ]
     